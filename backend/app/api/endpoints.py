@@ -1,40 +1,167 @@
+import asyncio
+import json
+import math
+from typing import Optional
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from ..core.processing import ingest_documents_from_urls
-from ..core.retriever import get_vector_store
-from ..core.agent import generate_response
+from ..core import config
+from ..core.jobs import get_job, start_ingest_job
+from ..core.retriever import get_embeddings, retrieval_stats
+from ..core.answer_cache import get_answer_cache
+from ..core.collection import get_collections, list_collections, validate_collection_name
+from ..core.context import context_stats
+from ..core.metrics import latency_summary
+from ..core.scheduler import UpstreamUnavailable, scheduler_stats
+from ..core.sources import validate_source_url
+from ..core.agent import current_runtime, get_runtime
 
 router = APIRouter()
 
-# Global vector store (shared after ingestion)
-vector_store = None
+# Caps in-flight graph executions per worker; extra requests wait for a slot
+_query_slots = asyncio.Semaphore(config.MAX_CONCURRENT_QUERIES)
 
 
 class IngestRequest(BaseModel):
     urls: list[str]
+    collection: str = config.DEFAULT_COLLECTION
 
 
 class QueryRequest(BaseModel):
     query: str
+    # Collections to search; the default collection when omitted
+    collections: Optional[list[str]] = None
 
 
-@router.post("/ingest")
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    ordered: bool = True
+    collections: Optional[list[str]] = None
+
+
+def _collection_name(name: str) -> str:
+    try:
+        return validate_collection_name(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _selected_collections(names: Optional[list[str]]) -> list[str]:
+    """Validated, de-duplicated collection names; unknown ones are a 404 (an empty default is fine)."""
+    names = list(dict.fromkeys(_collection_name(name) for name in names or [config.DEFAULT_COLLECTION]))
+    if len(names) > config.MAX_QUERY_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {config.MAX_QUERY_COLLECTIONS} collections per query")
+    registry = get_collections()
+    for name in names:
+        if name != config.DEFAULT_COLLECTION and registry.version(name) is None:
+            raise HTTPException(status_code=404, detail=f"Unknown collection {name!r}")
+    return names
+
+
+def _source_urls(urls: list[str]) -> list[str]:
+    try:
+        return [validate_source_url(url) for url in urls]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/ingest", status_code=202)
 async def ingest_docs(request: IngestRequest):
-    global vector_store
-    vector_store = ingest_documents_from_urls(request.urls)
-    if vector_store:
-        return {"status": "success", "message": "Documents ingested successfully."}
-    raise HTTPException(status_code=400, detail="Failed to ingest documents")
+    job = start_ingest_job(_source_urls(request.urls), _collection_name(request.collection))
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job")
+    return job.to_dict()
+
+
+@router.get("/collections")
+async def collections():
+    registry = get_collections()
+    resident = registry.stats()["resident"]
+    return {"collections": [
+        {"name": name, "version": registry.version(name), "resident": name in resident}
+        for name in list_collections()
+    ]}
 
 
 @router.post("/query")
 async def process_query(request: QueryRequest):
-    global vector_store
-    if not vector_store:
-        vector_store = get_vector_store()
+    collections = _selected_collections(request.collections)
+    runtime = await current_runtime()
 
     try:
-        answer = generate_response(request.query, vector_store)
-        return {"answer": answer}
+        async with _query_slots:
+            return await runtime.arun(request.query, collections)
+    except UpstreamUnavailable as e:
+        # Quota exhausted or provider failing: tell clients when to come back instead of a 500
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """Server-sent events: node transitions, answer tokens, then a final "done" event."""
+    collections = _selected_collections(request.collections)
+    runtime = await current_runtime()
+
+    async def event_stream():
+        try:
+            async with _query_slots:
+                async for item in runtime.astream(request.query, collections):
+                    yield f"event: {item.pop('event')}\ndata: {json.dumps(item)}\n\n"
+        except UpstreamUnavailable as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e), 'retry_after': round(e.retry_after, 1)})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/query/batch")
+async def batch_query(request: BatchQueryRequest):
+    """Newline-delimited JSON, one {"index", "query", "answer" | "error"} object per query."""
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided")
+    if len(request.queries) > config.MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {config.MAX_BATCH_QUERIES} queries per batch")
+
+    collections = _selected_collections(request.collections)
+    runtime = await current_runtime()
+
+    async def result_stream():
+        try:
+            async for index, result in runtime.abatch(request.queries, ordered=request.ordered,
+                                                      collections=collections):
+                yield json.dumps({"index": index, "query": request.queries[index], **result}) + "\n"
+        except UpstreamUnavailable as e:
+            yield json.dumps({"error": str(e), "retry_after": round(e.retry_after, 1)}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+@router.get("/stats")
+async def stats():
+    answer_cache = get_answer_cache(get_embeddings())
+    runtime = get_runtime()
+    return {
+        "latency": latency_summary(),
+        "embedding_cache": get_embeddings().stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "retrieval": retrieval_stats(),
+        "context": context_stats(),
+        "collections": get_collections().stats(),
+        "web_search": runtime.search_tool.stats() if runtime else None,
+        "upstream": scheduler_stats(),
+    }
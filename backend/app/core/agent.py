@@ -1,75 +1,244 @@
 import os
-import google.generativeai as genai
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate
-from langgraph.graph import StateGraph, END
-from langchain_community.tools import TavilySearchResults
-from typing import TypedDict, List
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Dict, Tuple, TypedDict, List, Optional
+from . import config
+from .answer_cache import SemanticAnswerCache, get_answer_cache
+from .collection import Collection, CollectionRegistry, get_collections, lookup_collections, search_collections
+from .context import assemble_context, estimate_tokens
+from .fakes import FakeChatModel, fake_tavily_transport
+from .metrics import COALESCED_QUERIES, record_tokens, timed_call, timed_node, track_request
+from .scheduler import GEMINI_GENERATE, UpstreamUnavailable, get_provider
+from .symbolic import extract_problem, get_solver_pool
+from .web_search import WebSearchClient, normalize_query
+from .retriever import get_embeddings, lexical_lookup
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+PROMPT_TEMPLATE = """
+    You are a **Math Problem Solving Assistant**.
+    Solve the query step by step.
+    If context is provided, use it.
+    If not, solve using general math knowledge.
+
+    Question: {query}
+
+    Context:
+    {context}
+
+    Answer:
+    """
+
+
+GRAPH_NODES = ("symbolic", "retrieve", "web_search", "generate")
 
 
 class AgentState(TypedDict):
     query: str
+    # Collections searched for context
+    collections: List[str]
     context: List[str]
     answer: str
+    # Best retrieval relevance and the context source it selected:
+    # "knowledge_base", "both" or "web"; "symbolic" when SymPy answered directly
+    retrieval_score: float
+    source: str
+    web_searched: bool
+    # Estimated prompt-context tokens after assembly, and how many assembly removed
+    context_tokens: int
+    context_tokens_saved: int
+
+
+def initial_state(query: str, collections: Optional[List[str]] = None) -> AgentState:
+    return {"query": query, "collections": collections or [config.DEFAULT_COLLECTION], "context": [], "answer": "",
+            "retrieval_score": 0.0, "source": "knowledge_base", "web_searched": False, "context_tokens": 0,
+            "context_tokens_saved": 0}
+
+
+def classify_retrieval(docs: list, score: float) -> str:
+    if not docs or score < config.RETRIEVAL_MIN_SCORE:
+        return "web"
+    if score < config.RETRIEVAL_CONFIDENT_SCORE:
+        return "both"
+    return "knowledge_base"
+
+
+# Bounded pool for CPU-bound FAISS and BM25 work so it stays off the event loop. Query
+# embeddings are awaited on the loop instead, so upstream calls are not capped at SEARCH_THREADS.
+_search_executor = ThreadPoolExecutor(max_workers=config.SEARCH_THREADS, thread_name_prefix="faiss-search")
+
+
+async def run_blocking(func, *args):
+    """Run func on the search pool, carrying the request's timing context into the thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_search_executor, contextvars.copy_context().run, func, *args)
+
+
+async def search_knowledge_base(selected: List[Collection], queries: List[str], k: int,
+                                lexical: Optional[List[List[Tuple[List[int], bool]]]] = None) -> List[Tuple[list, float]]:
+    """
+    search_collections with the query embedding awaited here rather than in
+    a search thread. `lexical` holds per collection the lexical_lookup
+    results of every query; queries every collection serves from BM25 alone
+    are not embedded.
+    """
+    if not selected:
+        return [([], 0.0) for _ in queries]
+    if lexical is None:
+        def lookup_all():
+            return [[lexical_lookup(c.lexical_index, q) for q in queries] for c in selected]
 
+        lexical = await run_blocking(lookup_all)
 
-def retrieve(state: AgentState, vectorstore: FAISS):
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-    docs = retriever.get_relevant_documents(state["query"])
-    state["context"] = [doc.page_content for doc in docs]
+    needed = [i for i in range(len(queries)) if not all(hits[i][1] for hits in lexical)]
+    vectors = [None] * len(queries)
+    if needed:
+        embeddings = selected[0].vectorstore.embeddings
+        texts = [queries[i] for i in needed]
+        with timed_call("embed_query"):
+            if hasattr(embeddings, "aembed_queries"):
+                embedded = await embeddings.aembed_queries(texts)
+            else:
+                embedded = await asyncio.gather(*(embeddings.aembed_query(t) for t in texts))
+        for i, vector in zip(needed, embedded):
+            vectors[i] = vector
+    return await run_blocking(search_collections, selected, queries, k, lexical, vectors)
+
+
+async def solve_symbolically(query: str) -> Optional[str]:
+    # Only queries that parse as a plain problem are sent to a solver process
+    if not config.SYMBOLIC_ENABLED or extract_problem(query) is None:
+        return None
+    with timed_call("symbolic"):
+        return await get_solver_pool().solve(query)
+
+
+async def symbolic(state: AgentState):
+    """Exact SymPy answer for plain algebra/arithmetic; anything else falls through to retrieve."""
+    answer = await solve_symbolically(state["query"])
+    if answer is not None:
+        state["answer"] = answer
+        state["source"] = "symbolic"
     return state
 
 
-def web_search(state: AgentState):
-    tool = TavilySearchResults(max_results=3)
-    results = tool.invoke({"query": state["query"]})
-    snippets = [r["content"] for r in results]
-    state["context"] = snippets
+def symbolic_router(state: AgentState):
+    return "done" if state["source"] == "symbolic" else "retrieve"
+
+
+async def search_snippets(tool: WebSearchClient, query: str) -> List[str]:
+    with timed_call("web_search"):
+        return await tool.search(query)
+
+
+def _merge_web_context(state: AgentState, snippets: List[str]):
+    state["context"] = state["context"] + snippets if state["source"] == "both" else snippets
+    state["web_searched"] = True
+
+
+async def _add_web_context(state: AgentState, search: Awaitable[List[str]]):
+    try:
+        snippets = await search
+    except Exception:
+        # Borderline results can still be answered from the knowledge base alone
+        if state["source"] != "both":
+            raise
+        snippets = []
+    _merge_web_context(state, snippets)
+
+
+async def retrieve(state: AgentState, collections: CollectionRegistry, search_tool: Optional[WebSearchClient] = None):
+    """
+    Retrieve from the selected collections (loading cold ones) and classify
+    the result by score. By default the web search only starts once the score
+    is known to be borderline or low. With SPECULATIVE_SEARCH it starts
+    alongside the vector search when no collection has a strong BM25 match,
+    and is cancelled if the score turns out confident.
+    """
+    query = state["query"]
+    selected = await run_blocking(collections.resolve, state["collections"])
+    lexical = await run_blocking(lookup_collections, selected, query)
+
+    speculative = None
+    if search_tool is not None and config.SPECULATIVE_SEARCH and not any(strong for _, strong in lexical):
+        speculative = asyncio.ensure_future(search_snippets(search_tool, query))
+
+    try:
+        (docs, score), = await search_knowledge_base(
+            selected, [query], config.CONTEXT_CANDIDATES, [[hit] for hit in lexical]
+        )
+        state["context"] = [doc.page_content for doc in docs]
+        state["retrieval_score"] = score
+        state["source"] = classify_retrieval(docs, score)
+        if speculative is not None and state["source"] != "knowledge_base":
+            await _add_web_context(state, speculative)
+    finally:
+        if speculative is not None and not speculative.done():
+            speculative.cancel()
     return state
 
 
-def generate(state: AgentState):
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0)
+async def web_search(state: AgentState, tool: WebSearchClient):
+    await _add_web_context(state, search_snippets(tool, state["query"]))
+    return state
 
-    prompt = ChatPromptTemplate.from_template("""
-    You are a **Math Problem Solving Assistant**.
-    Solve the query step by step. 
-    If context is provided, use it. 
-    If not, solve using general math knowledge.
-    
-    Question: {query}
-    
-    Context:
-    {context}
-    
-    Answer:
-    """)
 
-    chain = prompt | llm
-    response = chain.invoke({"query": state["query"], "context": "\n".join(state["context"])})
+async def generate(state: AgentState, chain):
+    context, usage = assemble_context(state["context"])
+    state.update(usage)
+    estimated_input = state["context_tokens"] + estimate_tokens(state["query"])
+    provider = get_provider(GEMINI_GENERATE)
+    booked = estimated_input + config.GENERATE_OUTPUT_TOKENS_ESTIMATE
+    with timed_call("llm"):
+        response = await provider.acall(
+            lambda: chain.ainvoke({"query": state["query"], "context": "\n".join(context)}), tokens=booked
+        )
     state["answer"] = response.content
+
+    # Gemini reports usage; fall back to the same estimate context assembly uses
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens") or estimated_input
+    output_tokens = usage.get("output_tokens") or estimate_tokens(response.content)
+    provider.settle_tokens(booked, input_tokens + output_tokens)
+    record_tokens(input_tokens, output_tokens, context_saved=state["context_tokens_saved"])
     return state
 
 
 def router(state: AgentState):
-    if state["context"]:
+    if state["source"] == "knowledge_base" or state["web_searched"]:
         return "generate"
     else:
         return "web_search"
 
 
-def build_math_agent(vectorstore: FAISS):
+def build_math_agent(collections: CollectionRegistry, chain, search_tool: WebSearchClient):
+    from langgraph.graph import StateGraph, END
+
     workflow = StateGraph(AgentState)
 
-    workflow.add_node("retrieve", lambda s: retrieve(s, vectorstore))
-    workflow.add_node("web_search", web_search)
-    workflow.add_node("generate", generate)
+    async def symbolic_node(state: AgentState):
+        with timed_node("symbolic"):
+            return await symbolic(state)
+
+    async def retrieve_node(state: AgentState):
+        with timed_node("retrieve"):
+            return await retrieve(state, collections, search_tool)
+
+    async def web_search_node(state: AgentState):
+        with timed_node("web_search"):
+            return await web_search(state, search_tool)
+
+    async def generate_node(state: AgentState):
+        with timed_node("generate"):
+            return await generate(state, chain)
 
-    workflow.set_entry_point("retrieve")
+    workflow.add_node("symbolic", symbolic_node)
+    workflow.add_node("retrieve", retrieve_node)
+    workflow.add_node("web_search", web_search_node)
+    workflow.add_node("generate", generate_node)
+
+    workflow.set_entry_point("symbolic")
+    workflow.add_conditional_edges("symbolic", symbolic_router, {"retrieve": "retrieve", "done": END})
     workflow.add_conditional_edges("retrieve", router, {"generate": "generate", "web_search": "web_search"})
     workflow.add_edge("web_search", "generate")
     workflow.add_edge("generate", END)
@@ -77,7 +246,235 @@ def build_math_agent(vectorstore: FAISS):
     return workflow.compile()
 
 
-def generate_response(query: str, vectorstore: FAISS) -> str:
-    agent = build_math_agent(vectorstore)
-    result = agent.invoke({"query": query, "context": [], "answer": ""})
-    return result["answer"]
+def _gemini_chat_model():
+    # Imported on first use: the Gemini SDK and its LangChain bindings are the
+    # slowest imports in the app and fake-backend workers never need them
+    import google.generativeai as genai
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    # The upstream scheduler owns retries, so the client makes a single attempt
+    return ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0, max_retries=1)
+
+
+def _summary(state: AgentState) -> dict:
+    return {key: state[key] for key in ("answer", "source", "context_tokens", "context_tokens_saved")}
+
+
+class AgentRuntime:
+    """
+    Long-lived clients and compiled graph shared by every request. Indexes
+    are not part of the runtime: each request names the collections it
+    searches and the registry loads, reloads and evicts them underneath.
+    """
+
+    def __init__(self, llm=None, prompt=None, search_tool=None, answer_cache: Optional[SemanticAnswerCache] = None,
+                 collections: Optional[CollectionRegistry] = None):
+        from langchain.prompts import ChatPromptTemplate
+
+        fake = config.UPSTREAM_BACKEND == "fake"
+        self.llm = llm or (FakeChatModel() if fake else _gemini_chat_model())
+        self.prompt = prompt or ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+        self.search_tool = search_tool or WebSearchClient(transport=fake_tavily_transport() if fake else None)
+        self.answer_cache = answer_cache or get_answer_cache(get_embeddings())
+        self.collections = collections or get_collections()
+        self.chain = self.prompt | self.llm
+        self.graph = build_math_agent(self.collections, self.chain, self.search_tool)
+        # Collections + normalized query -> graph execution in progress, shared by identical concurrent requests
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def kb_version(self, collections: List[str]) -> str:
+        """Identifies the knowledge base a query is answered from, so cached answers never cross versions."""
+        return "+".join(f"{name}@{self.collections.version(name)}" for name in collections)
+
+    def _cacheable(self, query: str) -> bool:
+        # Symbolic problems are solved locally; an embedding lookup would only slow them down
+        return self.answer_cache is not None and extract_problem(query) is None
+
+    async def cached_answer(self, query: str, collections: List[str]) -> Optional[str]:
+        if not self._cacheable(query):
+            return None
+        with timed_call("answer_cache"):
+            kb_version = await run_blocking(self.kb_version, collections)
+            vector = await self.answer_cache.embeddings.aembed_query(query)
+            return await run_blocking(self.answer_cache.lookup, query, kb_version, vector)
+
+    async def remember_answer(self, query: str, answer: str, collections: List[str]):
+        if self._cacheable(query) and answer:
+            vector = await self.answer_cache.embeddings.aembed_query(query)
+            await run_blocking(self.answer_cache.store, query, answer, self.kb_version(collections), vector)
+
+    async def _answer(self, query: str, collections: List[str]) -> dict:
+        cached = await self.cached_answer(query, collections)
+        if cached is not None:
+            return {"answer": cached, "cached": True}
+        result = await self.graph.ainvoke(initial_state(query, collections))
+        await self.remember_answer(query, result["answer"], collections)
+        return _summary(result)
+
+    async def arun(self, query: str, collections: Optional[List[str]] = None) -> dict:
+        """
+        Answer plus how it was produced: source, cache hit, context token usage
+        and a per-node/per-call timing breakdown in milliseconds.
+        Identical (normalized) queries already in flight are not run again:
+        the caller waits for that execution and gets its result, marked
+        "coalesced". A disconnecting caller never cancels it for the others.
+        """
+        collections = collections or [config.DEFAULT_COLLECTION]
+        with track_request("query") as timings:
+            key = ",".join(collections) + "\0" + normalize_query(query)
+            execution = self._in_flight.get(key)
+            coalesced = execution is not None
+            if coalesced:
+                COALESCED_QUERIES.labels("query").inc()
+            else:
+                execution = asyncio.ensure_future(self._answer(query, collections))
+                self._in_flight[key] = execution
+                execution.add_done_callback(
+                    lambda done: self._in_flight.pop(key) if self._in_flight.get(key) is done else None
+                )
+            result = await asyncio.shield(execution)
+            return {**result, **({"coalesced": True} if coalesced else {}), "timings": timings}
+
+    async def ainvoke(self, query: str, collections: Optional[List[str]] = None) -> str:
+        return (await self.arun(query, collections))["answer"]
+
+    async def astream(self, query: str, collections: Optional[List[str]] = None) -> AsyncIterator[dict]:
+        """
+        Yield node transitions and generate-node tokens as they happen:
+        {"event": "node", "node": ..., "status": "start"|"end"},
+        {"event": "token", "text": ...} and finally {"event": "done", "answer": ..., "source": ..., "context_tokens_saved": ...}.
+        A semantic cache hit skips the graph and yields only the done event.
+        """
+        collections = collections or [config.DEFAULT_COLLECTION]
+        with track_request("stream") as timings:
+            cached = await self.cached_answer(query, collections)
+            if cached is None:
+                result = initial_state(query, collections)
+                async for event in self.graph.astream_events(initial_state(query, collections), version="v2"):
+                    kind, name = event["event"], event["name"]
+                    if kind in ("on_chain_start", "on_chain_end") and name in GRAPH_NODES:
+                        yield {"event": "node", "node": name, "status": "start" if kind == "on_chain_start" else "end"}
+                    elif kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "generate":
+                        text = event["data"]["chunk"].content
+                        if text:
+                            yield {"event": "token", "text": text}
+                    elif kind == "on_chain_end" and name == "LangGraph":
+                        result = event["data"]["output"]
+                await self.remember_answer(query, result["answer"], collections)
+        done = {"answer": cached, "cached": True} if cached is not None else _summary(result)
+        yield {"event": "done", **done, "timings": timings}
+
+    async def abatch(self, queries: List[str], ordered: bool = True,
+                     collections: Optional[List[str]] = None) -> AsyncIterator[Tuple[int, dict]]:
+        """
+        Answer many queries at once: queries SymPy can solve are answered
+        first, the rest share one embedding call and one FAISS search per
+        selected collection for the retrieve step (lexical fast-path queries skip both), then
+        web_search/generate fan out with BATCH_CONCURRENCY. Yields
+        (index, {"answer": ...} or {"error": ...}) in input order, or as they
+        complete when ordered is False. Repeated (normalized) questions are
+        answered once and the result is shared, marked "coalesced".
+        """
+        collections = collections or [config.DEFAULT_COLLECTION]
+        leaders: Dict[str, int] = {}
+        for i, query in enumerate(queries):
+            leaders.setdefault(normalize_query(query), i)
+        leader_of = [leaders[normalize_query(q)] for q in queries]
+
+        symbolic_answers = await asyncio.gather(*(
+            solve_symbolically(q) if leader_of[i] == i else asyncio.sleep(0) for i, q in enumerate(queries)
+        ))
+        pending = [i for i, answer in enumerate(symbolic_answers) if answer is None and leader_of[i] == i]
+
+        if pending:
+            selected = await run_blocking(self.collections.resolve, collections)
+            retrieved = dict(zip(pending, await search_knowledge_base(
+                selected, [queries[i] for i in pending], config.CONTEXT_CANDIDATES,
+            )))
+        else:
+            retrieved = {}
+        slots = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+
+        async def answer_one(index: int) -> Tuple[int, dict]:
+            query = queries[index]
+            if leader_of[index] != index:
+                _, result = await asyncio.shield(tasks[leader_of[index]])
+                COALESCED_QUERIES.labels("batch").inc()
+                return index, {**result, "coalesced": True}
+            if symbolic_answers[index] is not None:
+                return index, {"answer": symbolic_answers[index], "source": "symbolic"}
+            try:
+                async with slots:
+                    with track_request("batch") as timings:
+                        cached = await self.cached_answer(query, collections)
+                        if cached is not None:
+                            return index, {"answer": cached, "cached": True, "timings": timings}
+                        docs, score = retrieved[index]
+                        state = initial_state(query, collections)
+                        state["context"] = [doc.page_content for doc in docs]
+                        state["retrieval_score"] = score
+                        state["source"] = classify_retrieval(docs, score)
+                        if router(state) == "web_search":
+                            with timed_node("web_search"):
+                                state = await web_search(state, self.search_tool)
+                        with timed_node("generate"):
+                            state = await generate(state, self.chain)
+                        await self.remember_answer(query, state["answer"], collections)
+                        return index, {**_summary(state), "timings": timings}
+            except UpstreamUnavailable as e:
+                return index, {"error": str(e), "retry_after": round(e.retry_after, 1)}
+            except Exception as e:
+                return index, {"error": str(e)}
+
+        tasks = [asyncio.ensure_future(answer_one(i)) for i in range(len(queries))]
+        try:
+            for next_result in (tasks if ordered else asyncio.as_completed(tasks)):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+# Shared runtime, built once per worker
+_runtime: Optional[AgentRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def init_runtime() -> AgentRuntime:
+    """Build the runtime once (called from the FastAPI lifespan)."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AgentRuntime()
+        return _runtime
+
+
+def warm_up():
+    """
+    Everything the first request would otherwise build: the runtime and its
+    clients, the default collection and the SymPy worker processes. Safe to
+    run alongside requests, which build whatever is still missing on demand.
+    """
+    init_runtime()
+    get_collections().get(config.DEFAULT_COLLECTION)
+    if config.SYMBOLIC_ENABLED:
+        get_solver_pool().start()
+
+
+def get_runtime() -> Optional[AgentRuntime]:
+    return _runtime
+
+
+async def current_runtime() -> AgentRuntime:
+    """Runtime for the next request; index versions are hot-reloaded per collection by the registry."""
+    return _runtime or await asyncio.to_thread(init_runtime)
+
+
+async def agenerate_response(query: str, runtime: AgentRuntime, collections: Optional[List[str]] = None) -> str:
+    return await runtime.ainvoke(query, collections)
+
+
+def generate_response(query: str, runtime: AgentRuntime, collections: Optional[List[str]] = None) -> str:
+    """Blocking wrapper for scripts; the API uses agenerate_response."""
+    return asyncio.run(agenerate_response(query, runtime, collections))
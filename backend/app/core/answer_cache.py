@@ -0,0 +1,135 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+from . import config
+
+SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹", "0123456789")
+
+
+def numeric_signature(text: str) -> tuple:
+    """
+    Numbers appearing in a query, in order. Two phrasings of the same problem
+    embed almost identically even when a coefficient differs, so a cached
+    answer is only reused when the numbers match exactly.
+    """
+    return tuple(re.findall(r"\d+(?:\.\d+)?", text.translate(SUPERSCRIPTS)))
+
+
+class SemanticAnswerCache:
+    """
+    Previous answers indexed by normalized query embedding in a small FAISS
+    inner-product index. Entries expire after a TTL and the least recently
+    used are evicted past max_entries. Each entry records the knowledge base
+    (collections and their index versions) it was answered from and is only
+    served for that same knowledge base, so answers from an older index or
+    another curriculum are never reused.
+    """
+
+    def __init__(self, embeddings, threshold: float, max_entries: int, ttl_seconds: float):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._entries = OrderedDict()  # id -> (kb_version, signature, answer, created_at)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, query: str, vector: Optional[List[float]] = None) -> np.ndarray:
+        # Async callers embed the query on the event loop and pass the vector in
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+        vector = np.asarray([vector], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _remove(self, ids):
+        if ids:
+            self._index.remove_ids(np.asarray(ids, dtype=np.int64))
+            for entry_id in ids:
+                self._entries.pop(entry_id, None)
+
+    def lookup(self, query: str, kb_version, vector: Optional[List[float]] = None) -> Optional[str]:
+        vector = self._embed(query, vector)
+        signature = numeric_signature(query)
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            # A few extra neighbours: the same question may be cached for several knowledge bases
+            scores, ids = self._index.search(vector, min(10, self._index.ntotal))
+            now = time.time()
+            expired = []
+            for score, entry_id in zip(scores[0], ids[0]):
+                entry = self._entries.get(int(entry_id))
+                if entry is None or score < self.threshold:
+                    continue
+                entry_kb_version, entry_signature, answer, created_at = entry
+                if now - created_at > self.ttl_seconds:
+                    expired.append(int(entry_id))
+                    continue
+                if entry_kb_version == kb_version and entry_signature == signature:
+                    self._entries.move_to_end(int(entry_id))
+                    self._remove(expired)
+                    self.hits += 1
+                    return answer
+            self._remove(expired)
+            self.misses += 1
+            return None
+
+    def store(self, query: str, answer: str, kb_version, vector: Optional[List[float]] = None):
+        vector = self._embed(query, vector)
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.asarray([entry_id], dtype=np.int64))
+            self._entries[entry_id] = (kb_version, numeric_signature(query), answer, time.time())
+
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(self._entries)[:overflow])
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache(embeddings) -> Optional[SemanticAnswerCache]:
+    """Shared cache instance, or None when ANSWER_CACHE_ENABLED is false."""
+    global _answer_cache
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                embeddings,
+                threshold=config.ANSWER_CACHE_THRESHOLD,
+                max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+            )
+        return _answer_cache
@@ -0,0 +1,332 @@
+"""
+Offline benchmark and load test using the fake upstream backends.
+
+    python -m app.core.benchmark --scenarios ingest,memory,search,query --out benchmark.json
+
+No API keys or quota are used: embeddings, Gemini and Tavily are replaced by
+the deterministic stand-ins in app.core.fakes, with simulated latencies.
+Scenarios:
+  ingest  throughput of the streaming ingest pipeline over synthetic documents
+  memory  resident memory of loading each ingested index (mmap and writable)
+  search  FAISS latency (p50/p99), batch throughput and recall for INDEX_TYPE
+  query   end-to-end /api/query throughput and p50/p99 at each concurrency,
+          in-process through ASGI or against a running server with --url
+The 1M-chunk sizes need several GB of memory at 768 dimensions; lower
+--dim or the size lists for a quick run.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import faiss
+import httpx
+import numpy as np
+
+from . import config
+
+DOCUMENT_PAGES = 1000
+
+
+def _sizes(value: str) -> list:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _percentiles(latencies_ms: list) -> dict:
+    if not latencies_ms:
+        return {"p50_ms": None, "p99_ms": None, "mean_ms": None}
+    return {
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "mean_ms": round(float(np.mean(latencies_ms)), 3),
+    }
+
+
+def _use_corpus(work_dir: str, size: int) -> str:
+    """Point the index and embedding cache at this corpus' directory."""
+    from . import collection, retriever
+
+    base_dir = os.path.join(work_dir, f"corpus-{size}")
+    config.INDEX_DIR = os.path.join(base_dir, "index")
+    config.EMBEDDING_CACHE_PATH = os.path.join(base_dir, "embeddings.sqlite")
+    # A fresh cache per corpus, so a larger run does not hit a smaller run's vectors
+    retriever._embeddings = None
+    collection._registry = None
+    return base_dir
+
+
+def run_ingest(work_dir: str, size: int) -> dict:
+    from .fakes import synthetic_url
+    from .processing import ingest_documents_from_urls
+
+    _use_corpus(work_dir, size)
+    urls = [
+        synthetic_url(f"doc-{i}", min(DOCUMENT_PAGES, size - start))
+        for i, start in enumerate(range(0, size, DOCUMENT_PAGES))
+    ]
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    vector_store = ingest_documents_from_urls(urls)
+    seconds = time.perf_counter() - start
+    chunks = vector_store.index.ntotal if vector_store is not None else 0
+    del vector_store
+    gc.collect()
+    return {
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 1) if seconds else None,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": _peak_rss_mb(),
+        "index_bytes": _dir_bytes(config.INDEX_DIR),
+    }
+
+
+def _load_footprint(index_dir: str, dim: int, what: str) -> float:
+    """Runs in a fresh process so freed memory from earlier work does not hide the cost of loading."""
+    from .fakes import FakeEmbeddings
+    from .retriever import load_lexical_index, load_vector_store
+
+    before = _rss_mb()
+    # Held in `loaded` so the index is still resident when memory is measured; a discarded
+    # result would be freed before the second reading
+    if what == "lexical":
+        loaded = load_lexical_index(base_dir=index_dir)
+    else:
+        loaded = load_vector_store(FakeEmbeddings(dim=dim), base_dir=index_dir, writable=what == "writable")
+    footprint = round(_rss_mb() - before, 1)
+    del loaded
+    return footprint
+
+
+def run_memory(work_dir: str, size: int) -> dict:
+    index_dir = os.path.join(work_dir, f"corpus-{size}", "index")
+    if not os.path.isdir(index_dir):
+        return {"chunks": size, "skipped": "corpus not ingested"}
+    result = {"chunks": size, "index_bytes": _dir_bytes(index_dir)}
+    for what in ("read_only", "writable", "lexical"):
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            result[f"{what}_rss_mb"] = pool.apply(_load_footprint, (index_dir, config.FAKE_EMBEDDING_DIM, what))
+    return result
+
+
+def run_search(size: int, n_queries: int, k: int) -> dict:
+    from .index_factory import build_search_index, tune_search_index
+    from .index_report import _measure
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((size, config.FAKE_EMBEDDING_DIM), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+
+    # Queries near stored chunks, like real questions about ingested text
+    queries = vectors[rng.choice(size, min(n_queries, size), replace=False)]
+    queries = queries + rng.standard_normal(queries.shape, dtype=np.float32) * 0.05
+    faiss.normalize_L2(queries)
+    k = min(k, size)
+    _, truth = flat.search(queries, k)
+    del vectors
+
+    start = time.perf_counter()
+    index = build_search_index(flat)
+    build_seconds = time.perf_counter() - start
+    index = index if index is not None else flat
+    tune_search_index(index)
+
+    start = time.perf_counter()
+    index.search(queries, k)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "chunks": size,
+        "index_type": config.INDEX_TYPE if index is not flat else "flat",
+        "k": k,
+        "queries": len(queries),
+        **_measure(index, queries, truth, k),
+        "batch_queries_per_second": round(len(queries) / batch_seconds, 1) if batch_seconds else None,
+        "build_seconds": round(build_seconds, 3),
+    }
+
+
+def _benchmark_queries(n: int, corpus_size: int, seed: int) -> list:
+    """
+    Mix of knowledge-base questions (words of a stored page, so BM25 can take
+    the fast path), web-fallback questions and SymPy-solvable equations.
+    """
+    from .fakes import synthetic_page_text
+
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n):
+        kind = i % 5
+        if kind < 3:
+            page = rng.randrange(corpus_size)
+            text = synthetic_page_text(f"doc-{page // DOCUMENT_PAGES}", page % DOCUMENT_PAGES)
+            queries.append(" ".join(text.split()[:10]))
+        elif kind == 3:
+            queries.append(f"history of mathematical notation in century {rng.randint(1, 21)} case {seed}-{i}")
+        else:
+            a, b = rng.randint(1, 9), rng.randint(1, 9)
+            queries.append(f"Solve x^2 - {a + b}x + {a * b} = 0")
+    return queries
+
+
+async def _load(client: httpx.AsyncClient, queries: list, concurrency: int) -> dict:
+    pending = iter(queries)
+    latencies, errors, sources = [], 0, {}
+
+    async def worker():
+        nonlocal errors
+        for query in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/query", json={"query": query})
+                response.raise_for_status()
+                source = response.json().get("source") or ("cache" if response.json().get("cached") else "unknown")
+                sources[source] = sources.get(source, 0) + 1
+                latencies.append((time.perf_counter() - start) * 1000)
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(queries),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(latencies) / seconds, 2) if seconds else None,
+        **_percentiles(latencies),
+        "sources": sources,
+    }
+
+
+async def run_query(work_dir: str, corpus_size: int, levels: list, n_requests: int, url: str = None) -> list:
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=300)
+    else:
+        from .agent import init_runtime
+        from ..main import app
+
+        if not os.path.isdir(os.path.join(work_dir, f"corpus-{corpus_size}", "index")):
+            run_ingest(work_dir, corpus_size)
+        _use_corpus(work_dir, corpus_size)
+        init_runtime()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=300)
+
+    results = []
+    async with client:
+        for level in levels:
+            # A different seed per level so the answer cache rarely serves repeats
+            queries = _benchmark_queries(n_requests, corpus_size, seed=level)
+            results.append(await _load(client, queries, level))
+            print(f"🚦 concurrency {level}: {results[-1]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default="ingest,memory,search,query")
+    parser.add_argument("--ingest-sizes", default="1000,100000,1000000")
+    parser.add_argument("--search-sizes", default="1000,100000,1000000")
+    parser.add_argument("--search-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=config.RETRIEVAL_CANDIDATES)
+    parser.add_argument("--query-corpus", type=int, default=1000, help="chunks in the corpus /api/query runs against")
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--url", help="load-test a running server (started with UPSTREAM_BACKEND=fake)")
+    parser.add_argument("--dim", type=int, default=config.FAKE_EMBEDDING_DIM)
+    parser.add_argument("--embedding-latency-ms", type=float, default=config.FAKE_EMBEDDING_LATENCY_MS)
+    parser.add_argument("--llm-latency-ms", type=float, default=config.FAKE_LLM_LATENCY_MS)
+    parser.add_argument("--search-latency-ms", type=float, default=config.FAKE_SEARCH_LATENCY_MS)
+    parser.add_argument("--enforce-quotas", action="store_true",
+                        help="keep the configured upstream quotas (default: unlimited, to measure the pipeline itself)")
+    parser.add_argument("--work-dir", help="where corpora are written (default: a temporary directory)")
+    parser.add_argument("--out", default="benchmark.json")
+    args = parser.parse_args()
+
+    config.UPSTREAM_BACKEND = "fake"
+    config.FAKE_EMBEDDING_DIM = args.dim
+    config.FAKE_EMBEDDING_LATENCY_MS = args.embedding_latency_ms
+    config.FAKE_LLM_LATENCY_MS = args.llm_latency_ms
+    config.FAKE_SEARCH_LATENCY_MS = args.search_latency_ms
+    config.WEB_SEARCH_CACHE_PATH = ""
+    if not args.enforce_quotas:
+        config.UPSTREAM_QUOTAS = {name: (0.0, 0.0) for name in config.UPSTREAM_QUOTAS}
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="math-agent-bench-")
+    scenarios = args.scenarios.split(",")
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "faiss": faiss.__version__,
+        },
+        "settings": {
+            "dim": args.dim,
+            "embedding_latency_ms": args.embedding_latency_ms,
+            "embedding_latency_per_text_ms": config.FAKE_EMBEDDING_LATENCY_PER_TEXT_MS,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_token_latency_ms": config.FAKE_LLM_TOKEN_LATENCY_MS,
+            "search_latency_ms": args.search_latency_ms,
+            "index_type": config.INDEX_TYPE,
+            "ingest_embed_batch_size": config.INGEST_EMBED_BATCH_SIZE,
+            "ingest_embed_concurrency": config.INGEST_EMBED_CONCURRENCY,
+            "max_concurrent_queries": config.MAX_CONCURRENT_QUERIES,
+            "upstream_quotas": config.UPSTREAM_QUOTAS,
+        },
+        "results": {},
+    }
+
+    if "ingest" in scenarios:
+        report["results"]["ingest"] = [run_ingest(work_dir, size) for size in _sizes(args.ingest_sizes)]
+    if "memory" in scenarios:
+        report["results"]["memory"] = [run_memory(work_dir, size) for size in _sizes(args.ingest_sizes)]
+    if "search" in scenarios:
+        report["results"]["search"] = [
+            run_search(size, args.search_queries, args.k) for size in _sizes(args.search_sizes)
+        ]
+    if "query" in scenarios:
+        report["results"]["query"] = asyncio.run(
+            run_query(work_dir, args.query_corpus, _sizes(args.concurrency), args.requests, args.url)
+        )
+    report["peak_rss_mb"] = _peak_rss_mb()
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📈 Wrote benchmark results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
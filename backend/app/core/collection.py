@@ -0,0 +1,244 @@
+"""
+Named collections: each curriculum gets its own versioned index directory,
+loaded on first use and kept resident in a memory-budgeted LRU. The
+"default" collection lives directly in INDEX_DIR, so indexes built before
+collections existed keep working; the others live in INDEX_DIR/collections.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from . import config
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .retriever import (
+    batch_hybrid_search, current_index_version, get_embeddings, lexical_lookup, load_lexical_index, load_vector_store,
+    resident_bytes,
+)
+
+COLLECTIONS_SUBDIR = "collections"
+COLLECTION_NAME = re.compile(r"[a-z0-9][a-z0-9_-]{0,63}")
+
+
+def validate_collection_name(name: str) -> str:
+    if not COLLECTION_NAME.fullmatch(name):
+        raise ValueError(f"Invalid collection name {name!r}: use 1-64 lowercase letters, digits, '-' or '_'")
+    return name
+
+
+def collection_dir(name: str) -> str:
+    if name == config.DEFAULT_COLLECTION:
+        return config.INDEX_DIR
+    return os.path.join(config.INDEX_DIR, COLLECTIONS_SUBDIR, validate_collection_name(name))
+
+
+def list_collections() -> List[str]:
+    """Collections with at least one published index version."""
+    names = [config.DEFAULT_COLLECTION] if current_index_version(config.INDEX_DIR) else []
+    try:
+        entries = sorted(os.listdir(os.path.join(config.INDEX_DIR, COLLECTIONS_SUBDIR)))
+    except FileNotFoundError:
+        entries = []
+    return names + [
+        name for name in entries
+        if COLLECTION_NAME.fullmatch(name) and name not in names and current_index_version(collection_dir(name))
+    ]
+
+
+class Collection:
+    """One loaded index version of a collection; never mutated once built."""
+
+    def __init__(self, name: str, version: str, vectorstore: FAISS, lexical_index: Optional[BM25Index],
+                 size_bytes: int):
+        self.name = name
+        self.version = version
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.size_bytes = size_bytes
+
+
+class CollectionRegistry:
+    """
+    Resident collections, least recently used first. Loading one that would
+    take the total past COLLECTION_MEMORY_BUDGET_MB evicts the coldest until
+    it fits (the size of the index files a load reads is the estimate). Requests still
+    holding an evicted collection finish with it; it is freed afterwards.
+    A resident collection re-reads its CURRENT marker at most every
+    INDEX_RELOAD_INTERVAL_SECONDS and reloads in the background when another
+    worker published a new version.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.loads = 0
+        self.evictions = 0
+        self._resident: "OrderedDict[str, Collection]" = OrderedDict()
+        self._checked_at: Dict[str, float] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._reloading = set()
+        self._lock = threading.Lock()
+        self._reloader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="collection-reload")
+
+    def _load_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _load(self, name: str, version: str) -> Collection:
+        base_dir = collection_dir(name)
+        vectorstore = load_vector_store(get_embeddings(), base_dir=base_dir, version=version)
+        lexical_index = load_lexical_index(version, base_dir=base_dir)
+        return Collection(name, version, vectorstore, lexical_index, resident_bytes(base_dir, version))
+
+    def _install(self, collection: Collection):
+        with self._lock:
+            self._resident.pop(collection.name, None)
+            self._resident[collection.name] = collection
+            self._checked_at[collection.name] = time.monotonic()
+            self.loads += 1
+            total = sum(c.size_bytes for c in self._resident.values())
+            while total > self.budget_bytes and len(self._resident) > 1:
+                _, evicted = self._resident.popitem(last=False)
+                total -= evicted.size_bytes
+                self.evictions += 1
+                print(f"🧹 Evicted collection {evicted.name} ({evicted.size_bytes / 2 ** 20:.1f} MB)")
+
+    def get(self, name: str) -> Optional[Collection]:
+        """Resident collection, loading it on first use; None when it has no index yet. Blocking."""
+        with self._lock:
+            collection = self._resident.get(name)
+            if collection is not None:
+                self._resident.move_to_end(name)
+        if collection is not None:
+            self._check_marker(collection)
+            return collection
+
+        # One loader per collection; concurrent first requests wait for it
+        with self._load_lock(name):
+            with self._lock:
+                collection = self._resident.get(name)
+            if collection is not None:
+                return collection
+            version = current_index_version(collection_dir(name))
+            if version is None:
+                return None
+            collection = self._load(name, version)
+            self._install(collection)
+            return collection
+
+    def resolve(self, names: List[str]) -> List[Collection]:
+        return [c for c in (self.get(name) for name in names) if c is not None]
+
+    def version(self, name: str) -> Optional[str]:
+        """Served version of a collection, without loading it."""
+        with self._lock:
+            collection = self._resident.get(name)
+        return collection.version if collection is not None else current_index_version(collection_dir(name))
+
+    def _check_marker(self, collection: Collection):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at.get(collection.name, 0.0) < config.INDEX_RELOAD_INTERVAL_SECONDS:
+                return
+            self._checked_at[collection.name] = now
+        if current_index_version(collection_dir(collection.name)) in (None, collection.version):
+            return
+        with self._lock:
+            if collection.name in self._reloading:
+                return
+            self._reloading.add(collection.name)
+        self._reloader.submit(self._background_refresh, collection.name)
+
+    def _background_refresh(self, name: str):
+        try:
+            self.refresh(name)
+        except Exception as e:
+            print(f"⚠️ Reloading collection {name} failed: {e}")
+        finally:
+            with self._lock:
+                self._reloading.discard(name)
+
+    def refresh(self, name: str):
+        """Serve the latest published version of a resident collection; cold ones load it on next use."""
+        with self._load_lock(name):
+            with self._lock:
+                collection = self._resident.get(name)
+            version = current_index_version(collection_dir(name))
+            if collection is None or version in (None, collection.version):
+                return
+            self._install(self._load(name, version))
+
+    def stats(self) -> dict:
+        with self._lock:
+            resident = {
+                name: {"version": c.version, "size_mb": round(c.size_bytes / 2 ** 20, 1)}
+                for name, c in self._resident.items()
+            }
+            return {
+                "resident": resident,
+                "resident_mb": round(sum(c.size_bytes for c in self._resident.values()) / 2 ** 20, 1),
+                "budget_mb": round(self.budget_bytes / 2 ** 20, 1),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+def merge_results(results: List[Tuple[list, float]], k: int) -> Tuple[list, float]:
+    """
+    Reciprocal rank fusion of per-collection hits, keeping k chunks and the
+    best score. The same text found in several collections is fused into one
+    hit; ties go to the best-scoring collection.
+    """
+    if len(results) == 1:
+        return results[0]
+    ranked = sorted(results, key=lambda result: result[1], reverse=True)
+    docs, positions, rankings = [], {}, []
+    for hit_docs, _ in ranked:
+        ranking = []
+        for doc in hit_docs:
+            if doc.page_content not in positions:
+                positions[doc.page_content] = len(docs)
+                docs.append(doc)
+            ranking.append(positions[doc.page_content])
+        rankings.append(ranking)
+    fused = reciprocal_rank_fusion(rankings, k=config.RRF_K)
+    return [docs[position] for position in fused[:k]], ranked[0][1] if ranked else 0.0
+
+
+def lookup_collections(collections: List[Collection], query: str) -> List[Tuple[List[int], bool]]:
+    """lexical_lookup for one query in each collection."""
+    return [lexical_lookup(c.lexical_index, query) for c in collections]
+
+
+def search_collections(collections: List[Collection], queries: List[str], k: int,
+                       lexical: Optional[List[List[Tuple[List[int], bool]]]] = None,
+                       vectors: Optional[List[Optional[List[float]]]] = None) -> List[Tuple[list, float]]:
+    """
+    batch_hybrid_search in every collection, merged per query. `lexical`, if
+    given, holds per collection the lexical_lookup results of every query;
+    `vectors` the query embeddings already computed (every collection shares
+    the embeddings model).
+    """
+    if not collections:
+        return [([], 0.0) for _ in queries]
+    per_collection = [
+        batch_hybrid_search(c.vectorstore, c.lexical_index, queries, k, lexical[j] if lexical else None, vectors)
+        for j, c in enumerate(collections)
+    ]
+    return [merge_results([results[i] for results in per_collection], k) for i in range(len(queries))]
+
+
+_registry: Optional[CollectionRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_collections() -> CollectionRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CollectionRegistry(int(config.COLLECTION_MEMORY_BUDGET_MB * 2 ** 20))
+        return _registry
@@ -0,0 +1,133 @@
+import os
+
+# Gemini models
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+
+# Persistent FAISS index location; each ingest writes a new versioned sub-directory
+INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(os.getcwd(), "data", "index"))
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+# Serve chunk text from a per-version SQLite file instead of unpickling every Document into RAM
+COMPACT_DOCSTORE = os.getenv("COMPACT_DOCSTORE", "true").lower() == "true"
+# Named collections: "default" lives in INDEX_DIR itself, others in INDEX_DIR/collections/<name>.
+# Collections load on first use; the least recently used are evicted past the memory budget.
+DEFAULT_COLLECTION = os.getenv("DEFAULT_COLLECTION", "default")
+COLLECTION_MEMORY_BUDGET_MB = float(os.getenv("COLLECTION_MEMORY_BUDGET_MB", "2048"))
+MAX_QUERY_COLLECTIONS = int(os.getenv("MAX_QUERY_COLLECTIONS", "8"))
+# How often each worker re-reads the CURRENT marker to pick up versions other workers published
+INDEX_RELOAD_INTERVAL_SECONDS = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", "2"))
+# Ingest job status, shared by all workers so any of them can answer GET /ingest/{job_id}
+INGEST_JOBS_DIR = os.getenv("INGEST_JOBS_DIR", os.path.join(os.getcwd(), "data", "jobs"))
+
+# On-disk embedding cache (SQLite); oldest entries are evicted past the limit
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.getcwd(), "data", "embedding_cache.sqlite"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# Query embeddings that miss the cache are micro-batched across concurrent requests; 0 ms disables it
+QUERY_EMBED_BATCH_WAIT_MS = float(os.getenv("QUERY_EMBED_BATCH_WAIT_MS", "5"))
+QUERY_EMBED_BATCH_SIZE = int(os.getenv("QUERY_EMBED_BATCH_SIZE", "64"))
+QUERY_EMBED_BATCH_CONCURRENCY = int(os.getenv("QUERY_EMBED_BATCH_CONCURRENCY", "4"))
+
+# With several uvicorn workers, point this at an empty directory (wiped before each start) so
+# /metrics aggregates every worker; read by prometheus_client itself, so set it in the environment
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Query pipeline concurrency
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "64"))
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", "4"))
+
+# Semantic answer cache in front of the agent graph
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+# Batch query endpoint
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Ingest pipeline: download -> parse -> split -> embed, connected by bounded queues
+INGEST_DOWNLOAD_CONCURRENCY = int(os.getenv("INGEST_DOWNLOAD_CONCURRENCY", "4"))
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(os.cpu_count() or 2)))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+
+# Search index type built at ingest time: flat, ivf_flat, hnsw, ivf_pq, sq8 or sq_fp16
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+INDEX_IVF_NLIST = int(os.getenv("INDEX_IVF_NLIST", "0"))  # 0 picks ~4*sqrt(n)
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "0"))  # 0 picks the largest divisor of the dimension <= 64
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", "200"))
+INDEX_TRAIN_SIZE = int(os.getenv("INDEX_TRAIN_SIZE", "100000"))
+# Query-time knobs, applied when an index is loaded
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))
+
+# BM25 lexical index fused with vector search; strong lexical matches skip the query embedding
+LEXICAL_ENABLED = os.getenv("LEXICAL_ENABLED", "true").lower() == "true"
+LEXICAL_FASTPATH_SCORE = float(os.getenv("LEXICAL_FASTPATH_SCORE", "6.0"))
+LEXICAL_FASTPATH_COVERAGE = float(os.getenv("LEXICAL_FASTPATH_COVERAGE", "1.0"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Score-aware routing: cosine relevance of the best vector hit decides KB, web or both
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.55"))
+RETRIEVAL_CONFIDENT_SCORE = float(os.getenv("RETRIEVAL_CONFIDENT_SCORE", "0.75"))
+# Start the web search alongside vector search when BM25 finds no strong match,
+# cancelling it once the score is confident: lower fallback latency, more Tavily quota
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "false").lower() == "true"
+
+# Tavily web search client
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com/search")
+WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "3"))
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "20"))
+WEB_SEARCH_MAX_CONNECTIONS = int(os.getenv("WEB_SEARCH_MAX_CONNECTIONS", "20"))
+WEB_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "3600"))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "5000"))
+# Optional SQLite layer shared across restarts; empty disables it
+WEB_SEARCH_CACHE_PATH = os.getenv("WEB_SEARCH_CACHE_PATH", "")
+
+# Deterministic SymPy fast path ahead of retrieval
+SYMBOLIC_ENABLED = os.getenv("SYMBOLIC_ENABLED", "true").lower() == "true"
+SYMBOLIC_TIMEOUT_SECONDS = float(os.getenv("SYMBOLIC_TIMEOUT_SECONDS", "2"))
+# SymPy runs in this many worker processes; one that overruns the timeout is killed
+SYMBOLIC_WORKERS = int(os.getenv("SYMBOLIC_WORKERS", "2"))
+# Equations above this degree, and expressions that expand past this many terms, go to the LLM
+SYMBOLIC_MAX_DEGREE = int(os.getenv("SYMBOLIC_MAX_DEGREE", "4"))
+SYMBOLIC_MAX_TERMS = int(os.getenv("SYMBOLIC_MAX_TERMS", "200"))
+
+# Context assembly before generate: overlap merge, near-duplicate removal, MMR, token budget
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+# Upstream backends: "live" (Gemini + Tavily) or "fake" (deterministic local stand-ins for benchmarks)
+UPSTREAM_BACKEND = os.getenv("UPSTREAM_BACKEND", "live")
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "768"))
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "40"))
+FAKE_EMBEDDING_LATENCY_PER_TEXT_MS = float(os.getenv("FAKE_EMBEDDING_LATENCY_PER_TEXT_MS", "0.5"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "400"))
+FAKE_LLM_TOKEN_LATENCY_MS = float(os.getenv("FAKE_LLM_TOKEN_LATENCY_MS", "5"))
+FAKE_SEARCH_LATENCY_MS = float(os.getenv("FAKE_SEARCH_LATENCY_MS", "300"))
+
+# Upstream quotas per provider: (requests per minute, tokens per minute); 0 means unlimited
+UPSTREAM_QUOTAS = {
+    "gemini_embedding": (float(os.getenv("GEMINI_EMBEDDING_RPM", "1500")), float(os.getenv("GEMINI_EMBEDDING_TPM", "0"))),
+    "gemini_generate": (float(os.getenv("GEMINI_GENERATE_RPM", "1000")), float(os.getenv("GEMINI_GENERATE_TPM", "4000000"))),
+    "tavily": (float(os.getenv("TAVILY_RPM", "100")), 0.0),
+}
+# Adaptive concurrency starts at (and never exceeds) this many calls per provider, halving on 429
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "32"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_RETRY_BASE_SECONDS = float(os.getenv("UPSTREAM_RETRY_BASE_SECONDS", "0.5"))
+UPSTREAM_RETRY_MAX_SECONDS = float(os.getenv("UPSTREAM_RETRY_MAX_SECONDS", "20"))
+# Calls that would wait longer than this for quota fail fast with 503 instead
+UPSTREAM_MAX_QUEUE_SECONDS = float(os.getenv("UPSTREAM_MAX_QUEUE_SECONDS", "30"))
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN_SECONDS", "30"))
+# Output tokens booked against the generate TPM bucket before Gemini reports usage
+GENERATE_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("GENERATE_OUTPUT_TOKENS_ESTIMATE", "512"))
+
+# Build the runtime, load the default collection and import SymPy in a background task once the
+# worker is accepting connections; false does it in the lifespan before the first request is served
+BACKGROUND_WARMUP = os.getenv("BACKGROUND_WARMUP", "true").lower() == "true"
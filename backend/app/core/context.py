@@ -0,0 +1,114 @@
+import re
+import threading
+from typing import List, Tuple
+
+from . import config
+
+MIN_OVERLAP = 40
+CHARS_PER_TOKEN = 4
+
+_totals = {"requests": 0, "tokens_before": 0, "tokens_after": 0}
+_totals_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    # Gemini's tokenizer is not available locally; ~4 characters per token is close for English
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is a prefix of b (at least MIN_OVERLAP chars)."""
+    head = b[:MIN_OVERLAP]
+    if len(head) < MIN_OVERLAP:
+        return 0
+    start = a.find(head, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(head, start + 1)
+    return 0
+
+
+def merge_overlapping(passages: List[str]) -> List[str]:
+    """
+    Join chunks that the splitter cut with chunk_overlap, so the shared text
+    appears once. The merged passage keeps the rank of its best part.
+    """
+    merged = list(passages)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(len(merged)):
+                if i == j:
+                    continue
+                size = _overlap(merged[i], merged[j])
+                if size:
+                    merged[min(i, j)] = merged[i] + merged[j][size:]
+                    del merged[max(i, j)]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def _similarity(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def assemble_context(passages: List[str], budget: int = None) -> Tuple[List[str], dict]:
+    """
+    Turn ranked passages into prompt context: merge overlapping chunks, drop
+    near-duplicates, order the rest by MMR (rank relevance vs. word-shingle
+    similarity to what is already selected) and stop at the token budget.
+    Returns the selected passages and token accounting for the request.
+    """
+    budget = budget or config.CONTEXT_TOKEN_BUDGET
+    tokens_before = estimate_tokens("\n".join(passages))
+
+    candidates = merge_overlapping([p for p in passages if p.strip()])
+    shingles = [_shingles(p) for p in candidates]
+    relevance = [1.0 / (rank + 1) for rank in range(len(candidates))]
+
+    selected, selected_shingles, used = [], [], 0
+    remaining = list(range(len(candidates)))
+    while remaining:
+        def mmr(i):
+            redundancy = max((_similarity(shingles[i], s) for s in selected_shingles), default=0.0)
+            return config.CONTEXT_MMR_LAMBDA * relevance[i] - (1 - config.CONTEXT_MMR_LAMBDA) * redundancy
+
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+        if any(_similarity(shingles[best], s) >= config.CONTEXT_DUPLICATE_THRESHOLD for s in selected_shingles):
+            continue
+        text = candidates[best]
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            if selected:
+                continue
+            # A single oversized passage is truncated rather than dropped
+            text = text[:budget * CHARS_PER_TOKEN]
+            cost = estimate_tokens(text)
+        selected.append(text)
+        selected_shingles.append(shingles[best])
+        used += cost
+
+    tokens_after = estimate_tokens("\n".join(selected))
+    with _totals_lock:
+        _totals["requests"] += 1
+        _totals["tokens_before"] += tokens_before
+        _totals["tokens_after"] += tokens_after
+    return selected, {"context_tokens": tokens_after, "context_tokens_saved": tokens_before - tokens_after}
+
+
+def context_stats() -> dict:
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["tokens_saved"] = totals["tokens_before"] - totals["tokens_after"]
+    return totals
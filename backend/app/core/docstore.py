@@ -0,0 +1,91 @@
+"""
+Compact, disk-backed docstore for read-only index versions. Chunk text and
+metadata live in a per-version SQLite file keyed by FAISS position, so a
+serving worker keeps no Document objects in RAM and fetches the text of
+the top-k hits on demand. The file is written once when a version is saved
+and never modified, so it is opened immutable: no locking, no journal, and
+the open handle keeps working if the version directory is pruned later.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Union
+from urllib.request import pathname2url
+
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+CHUNKS_FILE = "chunks.sqlite"
+INSERT_BATCH_SIZE = 1000
+
+
+def write_chunk_store(documents: Iterable[Document], path: str):
+    """Write chunks in FAISS position order to a new SQLite file at `path`."""
+    conn = sqlite3.connect(path)
+    try:
+        # Written into a temporary version directory that is renamed into place, so no journal is needed
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE chunks (position INTEGER PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL)")
+        batch = []
+        for position, doc in enumerate(documents):
+            batch.append((position, doc.page_content, json.dumps(doc.metadata, default=str)))
+            if len(batch) == INSERT_BATCH_SIZE:
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)", batch)
+                batch = []
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class PositionIds:
+    """index_to_docstore_id for a ChunkStore: the docstore id of a FAISS position is the position."""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, position: int) -> int:
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return position
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class ChunkStore(Docstore):
+    """Read-only docstore over a chunks file written by write_chunk_store."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(
+            f"file:{pathname2url(os.path.abspath(path))}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        (self.size,) = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()
+
+    def fetch(self, positions: List[int]) -> List[Optional[Document]]:
+        """Documents at the given positions, in order (None for unknown ones), with one query."""
+        if not positions:
+            return []
+        placeholders = ",".join("?" * len(positions))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT position, content, metadata FROM chunks WHERE position IN ({placeholders})",
+                [int(p) for p in positions],
+            ).fetchall()
+        found = {
+            position: Document(page_content=content, metadata=json.loads(metadata))
+            for position, content, metadata in rows
+        }
+        return [found.get(int(p)) for p in positions]
+
+    def search(self, search: Union[str, int]) -> Union[str, Document]:
+        doc = self.fetch([int(search)])[0]
+        return doc if doc is not None else f"ID {search} not found."
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
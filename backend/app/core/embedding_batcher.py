@@ -0,0 +1,120 @@
+"""
+Cross-request micro-batching of query embeddings. Concurrent requests that
+miss the embedding cache queue their query here; a dispatcher thread
+collects queries for up to QUERY_EMBED_BATCH_WAIT_MS after the first one
+arrives (or until QUERY_EMBED_BATCH_SIZE are queued) and embeds the batch
+with a single upstream call, handing each waiter its own vector.
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from .metrics import EMBED_BATCH_SIZE
+
+
+def _settle(future: Future, result=None, exception: Optional[Exception] = None):
+    # An async waiter that was cancelled has already cancelled its future
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class EmbeddingBatcher:
+    """
+    While all `max_in_flight` batch calls are busy the dispatcher keeps
+    queueing, so batches grow with load instead of calls piling up.
+    """
+
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]], max_wait_ms: float,
+                 max_batch_size: int, max_in_flight: int):
+        self.embed_batch = embed_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.queries = 0
+        self._queue = queue.Queue()
+        self.max_in_flight = max_in_flight
+        self._slots = threading.Semaphore(max_in_flight)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, text: str) -> Future:
+        """Queue `text` for the next batch; the future resolves to its vector."""
+        with self._lock:
+            if self._dispatcher is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed-batch")
+                self._dispatcher = threading.Thread(target=self._dispatch, name="embed-batcher", daemon=True)
+                self._dispatcher.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        """Blocks the calling (worker) thread until the batch holding `text` is embedded."""
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> List[float]:
+        """
+        Awaits the batch holding `text` without occupying a thread, so batch
+        size is bounded by concurrent requests rather than by a thread pool.
+        """
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._collect()
+            self._slots.acquire()
+            # Queries that arrived while every batch call was busy join this batch
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._pool.submit(self._run, batch)
+
+    def _run(self, batch: list):
+        try:
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            with self._lock:
+                self.batches += 1
+                self.queries += len(batch)
+            EMBED_BATCH_SIZE.observe(len(texts))
+            try:
+                vectors = dict(zip(texts, self.embed_batch(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    _settle(future, exception=e)
+                return
+            for text, future in batch:
+                _settle(future, result=vectors[text])
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "queries": self.queries,
+                "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            }
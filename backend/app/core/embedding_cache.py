@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .embedding_batcher import EmbeddingBatcher
+
+# Hits refresh last_used at most this often, so most lookups are read-only
+RECENCY_RESOLUTION_SECONDS = 60
+# Other workers write the same file, so the tracked row count is re-synced this often
+RECOUNT_EVERY = 1000
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of an embeddings model.
+    Vectors are stored in SQLite keyed by sha256(model, kind, text), so an
+    unchanged chunk or a repeated query string never hits the network twice.
+    Document and query embeddings are cached separately because Gemini embeds
+    them with different task types.
+    With batch_wait_ms > 0, single-query misses from concurrent requests are
+    embedded together in micro-batches.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, path: str, max_entries: int = 200000,
+                 batch_wait_ms: float = 0, batch_size: int = 64, batch_concurrency: int = 4):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._batcher = (
+            EmbeddingBatcher(self._embed_queries_upstream, batch_wait_ms, batch_size, batch_concurrency)
+            if batch_wait_ms > 0 else None
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._recount()
+
+    def _recount(self):
+        (self._rows,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self._inserted_since_count = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        stale = []
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                    if now - last_used > RECENCY_RESOLUTION_SECONDS:
+                        stale.append(key)
+            if stale:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in stale])
+                self._conn.commit()
+        return found
+
+    def _store(self, items: dict):
+        now = time.time()
+        with self._lock:
+            # Keys are content hashes: a row another worker stored meanwhile holds the same vector
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items.items()],
+            )
+            self._rows += cursor.rowcount
+            self._inserted_since_count += cursor.rowcount
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self._inserted_since_count >= RECOUNT_EVERY:
+            self._recount()
+        if self._rows <= self.max_entries:
+            return
+        self._recount()
+        overflow = self._rows - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (overflow,)
+            )
+            self._rows -= overflow
+
+    def _partition(self, kind: str, texts: List[str]) -> Tuple[List[str], dict, dict]:
+        """Keys of texts, the cached vectors, and key -> text of the distinct misses."""
+        keys = [self._key(kind, t) for t in texts]
+        cached = self._lookup(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return keys, cached, missing
+
+    def _embed(self, kind: str, texts: List[str], compute) -> List[List[float]]:
+        keys, cached, missing = self._partition(kind, texts)
+        if missing:
+            vectors = np.asarray(compute(list(missing.values())), dtype=np.float32)
+            computed = dict(zip(missing.keys(), vectors.tolist()))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[k] for k in keys]
+
+    async def _aembed(self, kind: str, texts: List[str], acompute) -> List[List[float]]:
+        # SQLite reads and writes go to a thread; the upstream call is awaited on the event loop
+        keys, cached, missing = await asyncio.to_thread(self._partition, kind, texts)
+        if missing:
+            vectors = np.asarray(await acompute(list(missing.values())), dtype=np.float32)
+            computed = dict(zip(missing.keys(), vectors.tolist()))
+            await asyncio.to_thread(self._store, computed)
+            cached.update(computed)
+
+        return [cached[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self._batcher is not None:
+            return self._embed("query", [text], lambda t: [self._batcher.embed(t[0])])[0]
+        return self._embed("query", [text], lambda t: [self.embeddings.embed_query(t[0])])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Query embeddings for many texts with one upstream call for the misses."""
+        return self._embed("query", texts, self._embed_queries_upstream)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_queries([text]))[0]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_queries for the event loop: no thread waits on the network."""
+        return await self._aembed("query", texts, self._aembed_misses)
+
+    async def _aembed_misses(self, texts: List[str]) -> List[List[float]]:
+        if self._batcher is not None and len(texts) == 1:
+            return [await self._batcher.aembed(texts[0])]
+        try:
+            return await self.embeddings.aembed_documents(texts, task_type="retrieval_query")
+        except TypeError:
+            return await asyncio.gather(*(self.embeddings.aembed_query(t) for t in texts))
+
+    def _embed_queries_upstream(self, texts: List[str]) -> List[List[float]]:
+        try:
+            return self.embeddings.embed_documents(texts, task_type="retrieval_query")
+        except TypeError:
+            # Embeddings without a task_type switch embed queries one by one
+            return [self.embeddings.embed_query(t) for t in texts]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "query_batching": self._batcher.stats() if self._batcher else None,
+        }
@@ -0,0 +1,159 @@
+"""
+Deterministic local stand-ins for Gemini embeddings, the Gemini chat model
+and Tavily, selected with UPSTREAM_BACKEND=fake. Each simulates upstream
+latency (FAKE_*_LATENCY_MS) so benchmarks and load tests exercise the real
+pipeline without API keys or quota.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List
+
+import httpx
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from . import config
+
+SYNTHETIC_SCHEME = "synthetic://"
+
+_VOCABULARY = (
+    "algebra equation variable coefficient polynomial quadratic root factor integer fraction decimal "
+    "ratio proportion percent geometry triangle circle radius area perimeter volume angle theorem proof "
+    "calculus derivative integral limit function graph slope intercept vector matrix probability "
+    "statistics mean median mode variance counting addition subtraction multiplication division"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+class FakeEmbeddings(Embeddings):
+    """Unit vectors seeded by a hash of the text: identical text, identical vector."""
+
+    def __init__(self, dim: int = None, latency_ms: float = None, latency_per_text_ms: float = None):
+        self.dim = dim or config.FAKE_EMBEDDING_DIM
+        self.latency_ms = config.FAKE_EMBEDDING_LATENCY_MS if latency_ms is None else latency_ms
+        self.latency_per_text_ms = (
+            config.FAKE_EMBEDDING_LATENCY_PER_TEXT_MS if latency_per_text_ms is None else latency_per_text_ms
+        )
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        # Accepts Gemini's task_type so batched query embedding takes the same path as live
+        time.sleep((self.latency_ms + self.latency_per_text_ms * len(texts)) / 1000)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        await asyncio.sleep((self.latency_ms + self.latency_per_text_ms * len(texts)) / 1000)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model returning a deterministic step-by-step answer after a simulated delay."""
+
+    latency_ms: float = 0.0
+    token_latency_ms: float = 0.0
+
+    def __init__(self, **kwargs: Any):
+        kwargs.setdefault("latency_ms", config.FAKE_LLM_LATENCY_MS)
+        kwargs.setdefault("token_latency_ms", config.FAKE_LLM_TOKEN_LATENCY_MS)
+        super().__init__(**kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages: List[BaseMessage]) -> tuple:
+        prompt = "\n".join(str(m.content) for m in messages)
+        rng = random.Random(_seed(prompt))
+        steps = [f"Step {i + 1}: apply the {rng.choice(_VOCABULARY)} rule." for i in range(rng.randint(2, 5))]
+        answer = "\n".join(steps) + f"\n\n**Answer:** {rng.randint(1, 999)}"
+        return answer, len(prompt) // 4
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        answer, input_tokens = self._answer(messages)
+        output_tokens = len(answer) // 4
+        message = AIMessage(content=answer, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        answer, _ = self._answer(messages)
+        time.sleep((self.latency_ms + self.token_latency_ms * len(answer.split())) / 1000)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        answer, _ = self._answer(messages)
+        await asyncio.sleep((self.latency_ms + self.token_latency_ms * len(answer.split())) / 1000)
+        return self._result(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        answer, _ = self._answer(messages)
+        time.sleep(self.latency_ms / 1000)
+        for word in answer.split(" "):
+            time.sleep(self.token_latency_ms / 1000)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        answer, _ = self._answer(messages)
+        await asyncio.sleep(self.latency_ms / 1000)
+        for word in answer.split(" "):
+            await asyncio.sleep(self.token_latency_ms / 1000)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def fake_tavily_transport(latency_ms: float = None) -> httpx.MockTransport:
+    """httpx transport answering Tavily search requests locally, so WebSearchClient keeps its caching."""
+    latency_ms = config.FAKE_SEARCH_LATENCY_MS if latency_ms is None else latency_ms
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency_ms / 1000)
+        body = json.loads(request.content)
+        rng = random.Random(_seed(body["query"]))
+        results = [
+            {"content": f"{body['query']}: " + " ".join(rng.choice(_VOCABULARY) for _ in range(40))}
+            for _ in range(body.get("max_results", 3))
+        ]
+        return httpx.Response(200, json={"results": results})
+
+    return httpx.MockTransport(handler)
+
+
+def synthetic_url(name: str, pages: int) -> str:
+    return f"{SYNTHETIC_SCHEME}{name}/{pages}"
+
+
+def synthetic_page_text(name: str, page: int) -> str:
+    """~900 characters, so the ingest splitter yields one chunk per page."""
+    rng = random.Random(_seed(f"{name}/{page}"))
+    words = [rng.choice(_VOCABULARY) for _ in range(110)]
+    return (f"{name} page {page}. " + " ".join(words))[:900]
+
+
+def synthetic_pages(source: str) -> List[Document]:
+    """Pages of a synthetic document named like synthetic://<name>/<pages>."""
+    name, pages = source[len(SYNTHETIC_SCHEME):].rsplit("/", 1)
+    return [
+        Document(page_content=synthetic_page_text(name, page), metadata={"source": source, "page": page})
+        for page in range(int(pages))
+    ]
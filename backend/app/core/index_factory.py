@@ -0,0 +1,83 @@
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from . import config
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq8", "sq_fp16")
+ADD_BLOCK = 65536
+
+
+def _nlist(ntotal: int) -> int:
+    if config.INDEX_IVF_NLIST:
+        return config.INDEX_IVF_NLIST
+    # ~4*sqrt(n) lists, keeping at least 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+
+def _pq_m(dim: int) -> int:
+    if config.INDEX_PQ_M:
+        return config.INDEX_PQ_M
+    return max(m for m in range(1, min(dim, 64) + 1) if dim % m == 0)
+
+
+def factory_string(index_type: str, dim: int, ntotal: int) -> Optional[str]:
+    """faiss.index_factory description for index_type, or None when Flat is the right choice."""
+    if index_type == "flat":
+        return None
+    if index_type == "hnsw":
+        return f"HNSW{config.INDEX_HNSW_M},Flat"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    if index_type == "ivf_flat":
+        return f"IVF{_nlist(ntotal)},Flat"
+    if index_type == "ivf_pq":
+        # PQ with 8-bit codes needs 256 training points per sub-quantizer
+        if ntotal < 256:
+            return None
+        return f"IVF{_nlist(ntotal)},PQ{_pq_m(dim)}"
+    raise ValueError(f"Unknown INDEX_TYPE {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+
+
+def build_search_index(flat_index, index_type: str = None):
+    """
+    Build (and train, if needed) a search index of index_type holding the same
+    vectors, in the same order, as flat_index. Returns None when the flat
+    index should be searched directly.
+    """
+    index_type = index_type or config.INDEX_TYPE
+    ntotal, dim = flat_index.ntotal, flat_index.d
+    description = factory_string(index_type, dim, ntotal) if ntotal else None
+    if description is None:
+        return None
+
+    index = faiss.index_factory(dim, description, flat_index.metric_type)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = config.INDEX_HNSW_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        sample_size = min(ntotal, config.INDEX_TRAIN_SIZE)
+        sample_ids = np.sort(np.random.default_rng(0).choice(ntotal, sample_size, replace=False))
+        index.train(np.vstack([flat_index.reconstruct(int(i)) for i in sample_ids]))
+
+    for start in range(0, ntotal, ADD_BLOCK):
+        index.add(flat_index.reconstruct_n(start, min(ADD_BLOCK, ntotal - start)))
+
+    tune_search_index(index)
+    print(f"🧭 Built {description} search index over {ntotal} vectors")
+    return index
+
+
+def tune_search_index(index, nprobe: int = None, ef_search: int = None):
+    """Set query-time recall/latency knobs on whichever index type this is."""
+    nprobe = nprobe or config.INDEX_NPROBE
+    ef_search = ef_search or config.INDEX_EF_SEARCH
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
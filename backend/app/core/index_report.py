@@ -0,0 +1,104 @@
+"""
+Recall-vs-latency report for the current corpus.
+
+    python -m app.core.index_report --k 10 --queries 200 --out index_report.json
+
+Builds every index type from the persisted exact index, sweeps nprobe /
+efSearch, and measures recall@k against exact search, per-query latency
+and serialized size. Queries are sampled from the stored chunk vectors.
+"""
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from . import config
+from .index_factory import INDEX_TYPES, build_search_index, tune_search_index
+from .retriever import FLAT_INDEX_FILE, current_index_version
+
+NPROBE_SWEEP = (1, 4, 16, 64)
+EF_SEARCH_SWEEP = (16, 64, 256)
+
+
+def _measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+    }
+
+
+def build_report(flat_index, k: int = 10, n_queries: int = 200) -> dict:
+    ntotal = flat_index.ntotal
+    k = min(k, ntotal)
+    rng = np.random.default_rng(0)
+    query_ids = rng.choice(ntotal, min(n_queries, ntotal), replace=False)
+    queries = np.vstack([flat_index.reconstruct(int(i)) for i in query_ids])
+    _, truth = flat_index.search(queries, k)
+
+    results = []
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_search_index(flat_index, index_type) if index_type != "flat" else None
+        build_seconds = time.perf_counter() - start
+        if index is None:
+            if index_type != "flat":
+                results.append({"index_type": index_type, "skipped": "corpus too small"})
+                continue
+            index = flat_index
+
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            settings = [{"nprobe": n} for n in NPROBE_SWEEP if n <= ivf.nlist]
+        elif isinstance(index, faiss.IndexHNSW):
+            settings = [{"ef_search": ef} for ef in EF_SEARCH_SWEEP]
+        else:
+            settings = [{}]
+
+        for setting in settings:
+            tune_search_index(index, **setting)
+            results.append({
+                "index_type": index_type,
+                **setting,
+                **_measure(index, queries, truth, k),
+                "size_bytes": int(faiss.serialize_index(index).nbytes),
+                "build_seconds": round(build_seconds, 3),
+            })
+
+    return {"ntotal": ntotal, "dim": flat_index.d, "k": k, "queries": len(queries), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-dir", default=config.INDEX_DIR)
+    parser.add_argument("--out", default="index_report.json")
+    args = parser.parse_args()
+
+    version = current_index_version(args.index_dir)
+    if version is None:
+        raise SystemExit(f"No persisted index in {args.index_dir}")
+    flat_index = faiss.read_index(os.path.join(args.index_dir, version, FLAT_INDEX_FILE))
+
+    report = {"version": version, **build_report(flat_index, k=args.k, n_queries=args.queries)}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    for row in report["results"]:
+        print(row)
+    print(f"📈 Wrote recall-vs-latency report to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
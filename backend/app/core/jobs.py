@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from . import config
+from .collection import get_collections
+
+MAX_TRACKED_JOBS = 100
+# Progress-only updates are written to the shared jobs directory at most this often
+PERSIST_INTERVAL_SECONDS = 1.0
+
+# One ingest at a time so index versions are written in order
+_ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+_jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+class IngestJob:
+    """
+    Progress of one background ingestion, readable while it runs. Snapshots
+    are written to INGEST_JOBS_DIR so every worker can report on any job.
+    """
+
+    def __init__(self, urls: List[str], collection: str = config.DEFAULT_COLLECTION):
+        self.id = uuid.uuid4().hex
+        self.urls = urls
+        self.collection = collection
+        self.status = "queued"
+        self.pages_loaded = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._persisted_at = 0.0
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        state_changed = "status" in fields or "finished_at" in fields
+        if state_changed or time.time() - self._persisted_at >= PERSIST_INTERVAL_SECONDS:
+            self.persist()
+
+    def persist(self):
+        os.makedirs(config.INGEST_JOBS_DIR, exist_ok=True)
+        path = os.path.join(config.INGEST_JOBS_DIR, f"{self.id}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+        self._persisted_at = time.time()
+
+    @classmethod
+    def load(cls, job_id: str) -> Optional["IngestJob"]:
+        """Snapshot written by whichever worker runs the job."""
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        try:
+            with open(os.path.join(config.INGEST_JOBS_DIR, f"{job_id}.json")) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls(data["urls"], data.get("collection", config.DEFAULT_COLLECTION))
+        job.id = data["job_id"]
+        for name, value in data.items():
+            if name not in ("job_id", "urls", "collection"):
+                setattr(job, name, value)
+        return job
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "urls": self.urls,
+            "collection": self.collection,
+            "pages_loaded": self.pages_loaded,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _run(job: IngestJob):
+    # PDF loaders, the text splitter and the parse pool are only imported on the ingest path
+    from .processing import ingest_documents_from_urls
+
+    job.update(status="running")
+    try:
+        vector_store = ingest_documents_from_urls(job.urls, progress=job, collection=job.collection)
+        if vector_store is None:
+            job.update(status="failed", error="No documents were loaded")
+        else:
+            # Queries keep using the previous version until this swap. Reload the
+            # persisted version read-only so they get the trained search index;
+            # other workers pick it up from the CURRENT marker.
+            get_collections().refresh(job.collection)
+            job.update(status="succeeded")
+    except Exception as e:
+        job.update(status="failed", error=str(e))
+    finally:
+        job.update(finished_at=time.time())
+
+
+def _prune_job_files():
+    try:
+        names = [n for n in os.listdir(config.INGEST_JOBS_DIR) if n.endswith(".json")]
+    except FileNotFoundError:
+        return
+    paths = sorted((os.path.join(config.INGEST_JOBS_DIR, n) for n in names), key=os.path.getmtime)
+    for path in paths[:-MAX_TRACKED_JOBS]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def start_ingest_job(urls: List[str], collection: str = config.DEFAULT_COLLECTION) -> IngestJob:
+    job = IngestJob(urls, collection)
+    job.persist()
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_TRACKED_JOBS:
+            _jobs.popitem(last=False)
+    _prune_job_files()
+    _ingest_executor.submit(_run, job)
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    # Jobs started on another worker are only known through their snapshot
+    return job or IngestJob.load(job_id)
@@ -0,0 +1,94 @@
+import math
+import pickle
+import re
+from collections import defaultdict
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me of on or "
+    "please the to what when which who why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one index version. Document numbers are
+    FAISS positions, so lexical and vector hits refer to the same chunks.
+    Postings are kept as numpy arrays to stay compact once pickled.
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(lambda: ([], []))
+        lengths = []
+        for position, text in enumerate(texts):
+            counts = defaultdict(int)
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] += 1
+            for token, tf in counts.items():
+                positions, tfs = postings[token]
+                positions.append(position)
+                tfs.append(tf)
+            lengths.append(len(tokens))
+
+        self.n_docs = len(lengths)
+        self.doc_lengths = np.asarray(lengths, dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if self.n_docs else 0.0
+        self.postings = {
+            token: (np.asarray(positions, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for token, (positions, tfs) in postings.items()
+        }
+
+    def search(self, query: str, k: int) -> Tuple[List[Tuple[int, float]], float]:
+        """
+        Top-k (position, score) pairs, plus the fraction of query terms that
+        the best hit contains.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.n_docs:
+            return [], 0.0
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        matched = np.zeros(self.n_docs, dtype=np.int16)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-6))
+        for term in terms:
+            if term not in self.postings:
+                continue
+            positions, tfs = self.postings[term]
+            idf = math.log(1 + (self.n_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * tfs * (self.k1 + 1) / (tfs + norm[positions])
+            matched[positions] += 1
+
+        k = min(k, self.n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = [(int(p), float(scores[p])) for p in top if scores[p] > 0]
+        coverage = matched[hits[0][0]] / len(terms) if hits else 0.0
+        return hits, float(coverage)
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: str) -> "BM25Index":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[int]:
+    """Merge ranked position lists; items ranked high in any list float to the top."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            scores[position] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,150 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from . import config
+
+# Buckets span a cache hit / FAISS search (ms) up to a slow Gemini generation (tens of seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_SECONDS = Histogram(
+    "math_agent_request_seconds", "End-to-end query latency", ["mode"], buckets=LATENCY_BUCKETS
+)
+NODE_SECONDS = Histogram(
+    "math_agent_node_seconds", "Latency of each LangGraph node", ["node"], buckets=LATENCY_BUCKETS
+)
+CALL_SECONDS = Histogram(
+    "math_agent_call_seconds", "Latency of embedding, search, cache and LLM calls", ["call"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter("math_agent_llm_tokens_total", "Gemini tokens used by generate", ["kind"])
+EMBED_BATCH_SIZE = Histogram(
+    "math_agent_query_embed_batch_size", "Distinct queries per micro-batched embedding call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+UPSTREAM_WAIT_SECONDS = Histogram(
+    "math_agent_upstream_wait_seconds", "Time upstream calls queued for quota or a concurrency slot", ["provider"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RETRIES = Counter("math_agent_upstream_retries_total", "Retried upstream calls", ["provider", "reason"])
+# Gauge modes only apply with PROMETHEUS_MULTIPROC_DIR: in-flight calls add up across workers
+UPSTREAM_CONCURRENCY = Gauge(
+    "math_agent_upstream_in_flight", "Upstream calls in flight", ["provider"], multiprocess_mode="livesum"
+)
+COALESCED_QUERIES = Counter(
+    "math_agent_coalesced_queries_total", "Queries answered by an identical in-flight execution", ["mode"]
+)
+WARMUP_SECONDS = Gauge(
+    "math_agent_warmup_seconds", "Time the startup warm-up took in this worker; 0 until it has finished",
+    multiprocess_mode="liveall",
+)
+CONTEXT_TOKENS_SAVED = Counter(
+    "math_agent_context_tokens_saved_total", "Prompt tokens removed by context assembly"
+)
+
+# Timing breakdown of the request being served; agent.run_blocking copies the context
+# into the search pool so calls made from worker threads land in the same breakdown
+_breakdown: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("timing_breakdown", default=None)
+
+# Recent end-to-end latencies for the dashboard's summary numbers
+_recent = deque(maxlen=500)
+_recent_lock = threading.Lock()
+
+
+def _add(section: str, name: str, seconds: float):
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        timings = breakdown[section]
+        timings[name] = round(timings.get(name, 0.0) + seconds * 1000, 2)
+
+
+@contextmanager
+def track_request(mode: str) -> Iterator[dict]:
+    """
+    Collect a per-request timing breakdown: {"nodes": {...}, "calls": {...},
+    "total_ms": ...} in milliseconds. The dict is filled in place as nodes and
+    calls finish and total_ms is set when the block exits.
+    """
+    breakdown = {"nodes": {}, "calls": {}, "total_ms": 0.0}
+    _breakdown.set(breakdown)
+    start = time.perf_counter()
+    try:
+        yield breakdown
+    finally:
+        elapsed = time.perf_counter() - start
+        breakdown["total_ms"] = round(elapsed * 1000, 2)
+        REQUEST_SECONDS.labels(mode).observe(elapsed)
+        with _recent_lock:
+            _recent.append(elapsed)
+        # set rather than reset: streaming generators may finish in another context
+        _breakdown.set(None)
+
+
+@contextmanager
+def timed_node(node: str):
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    NODE_SECONDS.labels(node).observe(elapsed)
+    _add("nodes", node, elapsed)
+
+
+@contextmanager
+def timed_call(call: str):
+    """Time an upstream or blocking call; failed and cancelled calls are not recorded."""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    CALL_SECONDS.labels(call).observe(elapsed)
+    _add("calls", call, elapsed)
+
+
+def record_tokens(input_tokens: int, output_tokens: int, context_saved: int = 0):
+    LLM_TOKENS.labels("input").inc(input_tokens)
+    LLM_TOKENS.labels("output").inc(output_tokens)
+    if context_saved > 0:
+        CONTEXT_TOKENS_SAVED.inc(context_saved)
+
+
+def latency_summary() -> dict:
+    """Average and percentiles of recent request latencies, in seconds."""
+    with _recent_lock:
+        samples = sorted(_recent)
+    if not samples:
+        return {"requests": 0, "avg": None, "p50": None, "p95": None}
+
+    def percentile(p: float) -> float:
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))], 3)
+
+    return {
+        "requests": len(samples),
+        "avg": round(sum(samples) / len(samples), 3),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+    }
+
+
+def render_metrics() -> tuple:
+    """
+    Prometheus exposition body and content type for /metrics. With
+    PROMETHEUS_MULTIPROC_DIR set, every worker's samples are aggregated, so
+    any worker can answer the scrape; otherwise only this worker's.
+    """
+    if not config.PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_exited():
+    """Drop this worker's live gauges from the aggregate on shutdown."""
+    if config.PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,60 +1,252 @@
+import multiprocessing
 import os
-from typing import Optional
+import queue
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator, List, Optional
+from urllib.parse import urljoin
+
+import requests
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from .retriever import get_vector_store
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_core.documents import Document
 
+from . import config
+from .collection import collection_dir
+from .fakes import SYNTHETIC_SCHEME, synthetic_pages
+from .retriever import get_vector_store, get_embeddings, index_write_lock, save_vector_store
+from .sources import check_resolved_host, validate_source_url
 
-def ingest_documents_from_urls() -> Optional[any]:
-    """
-    Ingest documents directly from fixed hardcoded PDF URLs.
-    Steps:
-    1. Load PDFs from the provided URLs
-    2. Split into smaller chunks
-    3. Create embeddings using Gemini
-    4. Store them into FAISS vectorstore
-    Returns the vectorstore object if successful.
-    """
+# ✅ Default PDF URLs, used when an ingest request does not name any
+DEFAULT_URLS = [
+    "https://www.tutor.com/cmspublicfiles/www/concept-list.pdf",
+    # Add as many as you want here
+]
 
-    # ✅ Put your final PDF URLs here
-    urls = [
-        "https://www.tutor.com/cmspublicfiles/www/concept-list.pdf",
-        # Add as many as you want here
-    ]
+MAX_REDIRECTS = 5
 
-    documents = []
+_DONE = object()
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    # Spawned (not forked) workers: the API process is multi-threaded
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=config.INGEST_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _parse_pool
+
+
+def _download(url: str):
+    """Stream a PDF to a temp file. Returns (path, is_temp); synthetic URLs are parsed in place."""
+    validate_source_url(url)
+    if config.UPSTREAM_BACKEND == "fake" and url.startswith(SYNTHETIC_SCHEME):
+        return url, False
+    # Redirects are followed by hand so each hop is checked before it is fetched
+    for _ in range(MAX_REDIRECTS + 1):
+        check_resolved_host(url)
+        response = requests.get(url, stream=True, timeout=60, allow_redirects=False)
+        with response:
+            if response.is_redirect:
+                url = validate_source_url(urljoin(url, response.headers["location"]))
+                continue
+            response.raise_for_status()
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                for block in response.iter_content(chunk_size=1 << 16):
+                    f.write(block)
+                return f.name, True
+    raise ValueError(f"Too many redirects fetching {url}")
 
-    # ✅ Initialize Gemini Embeddings
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/embedding-001",
-        google_api_key=os.getenv("GOOGLE_API_KEY")
-    )
 
-    # ✅ Load PDFs
-    for url in urls:
+def _parse_pdf(path: str, source: str) -> List[Document]:
+    """Runs in the parse process pool."""
+    if source.startswith(SYNTHETIC_SCHEME):
+        return synthetic_pages(source)
+    pages = PyPDFLoader(path).load()
+    for page in pages:
+        page.metadata["source"] = source
+    return pages
+
+
+def _put(downloaded: queue.Queue, item, stop: threading.Event) -> bool:
+    # Blocks while the parse stage is behind, bounding files on disk, until the consumer stops
+    while not stop.is_set():
+        try:
+            downloaded.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _discard_downloads(downloaded: queue.Queue):
+    """Empty the queue, deleting temp files nobody will parse."""
+    while True:
         try:
-            loader = PyPDFLoader(url)
-            docs = loader.load()
-            documents.extend(docs)
-            print(f"📄 Loaded {len(docs)} pages from {url}")
+            item = downloaded.get_nowait()
+        except queue.Empty:
+            return
+        if item is not _DONE:
+            _, path, is_temp = item
+            if is_temp and os.path.exists(path):
+                os.remove(path)
+
+
+def _download_stage(urls: List[str], downloaded: queue.Queue, stop: threading.Event):
+    def fetch(url):
+        if stop.is_set():
+            return
+        try:
+            item = (url, *_download(url))
         except Exception as e:
             print(f"⚠️ Error loading document from {url}: {e}")
+            return
+        if not _put(downloaded, item, stop) and item[2]:
+            os.remove(item[1])
+
+    with ThreadPoolExecutor(max_workers=config.INGEST_DOWNLOAD_CONCURRENCY, thread_name_prefix="ingest-download") as pool:
+        list(pool.map(fetch, urls))
+    if not _put(downloaded, _DONE, stop):
+        # Files queued after the consumer stopped and drained
+        _discard_downloads(downloaded)
 
-    if not documents:
-        print("❌ No documents were loaded. Check URLs.")
-        return None
 
-    # ✅ Split docs into chunks
+def _iter_chunks(urls: List[str], progress=None) -> Iterator[Document]:
+    """
+    Download concurrently, parse in a process pool and split one PDF at a
+    time, yielding chunks as they are produced. Every stage is bounded, so
+    memory does not grow with the size of the corpus.
+    """
+    downloaded = queue.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+    stop = threading.Event()
+    threading.Thread(target=_download_stage, args=(urls, downloaded, stop), daemon=True).start()
+
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200
     )
-    split_documents = text_splitter.split_documents(documents)
+    parse_pool = _get_parse_pool()
+    parsing = deque()
+    downloads_done = False
+    pages_loaded = 0
+    chunks_total = 0
+
+    try:
+        while parsing or not downloads_done:
+            while not downloads_done and len(parsing) < config.INGEST_PARSE_WORKERS:
+                item = downloaded.get()
+                if item is _DONE:
+                    downloads_done = True
+                    break
+                url, path, is_temp = item
+                parsing.append((url, path, is_temp, parse_pool.submit(_parse_pdf, path, url)))
+            if not parsing:
+                continue
+
+            url, path, is_temp, future = parsing.popleft()
+            try:
+                pages = future.result()
+                print(f"📄 Loaded {len(pages)} pages from {url}")
+            except Exception as e:
+                print(f"⚠️ Error loading document from {url}: {e}")
+                pages = []
+            finally:
+                if is_temp:
+                    os.remove(path)
+
+            chunks = text_splitter.split_documents(pages)
+            pages_loaded += len(pages)
+            chunks_total += len(chunks)
+            if progress:
+                progress.update(pages_loaded=pages_loaded, chunks_total=chunks_total)
+            yield from chunks
+    finally:
+        stop.set()
+        _discard_downloads(downloaded)
+        for _, path, is_temp, future in parsing:
+            future.cancel()
+            if is_temp and os.path.exists(path):
+                os.remove(path)
+
+
+def _batches(chunks: Iterator[Document], size: int) -> Iterator[List[Document]]:
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_documents_from_urls(urls: Optional[List[str]] = None, progress=None,
+                               collection: Optional[str] = None) -> Optional[any]:
+    """
+    Ingest documents from PDF URLs (DEFAULT_URLS when none are given) into a
+    collection (DEFAULT_COLLECTION when none is named).
+    Steps, run as a streaming pipeline:
+    1. Download PDFs concurrently
+    2. Parse them in a process pool
+    3. Split each PDF into chunks as it is parsed
+    4. Embed chunks in batches with Gemini, several batches in flight
+    5. Store them into FAISS vectorstore and persist a new index version
+    `progress`, if given, is an IngestJob updated as pages and chunks are processed.
+    Returns the vectorstore object if successful.
+    """
+    urls = urls or DEFAULT_URLS
+    base_dir = collection_dir(collection or config.DEFAULT_COLLECTION)
+
+    # Writers in other workers wait here, so each ingest starts from the latest version
+    with index_write_lock(base_dir):
+        # ✅ Initialize Gemini Embeddings
+        embeddings = get_embeddings()
+
+        vector_store = None
+        chunks_embedded = 0
+        in_flight = deque()
+
+        def add_oldest():
+            nonlocal vector_store, chunks_embedded
+            batch, future = in_flight.popleft()
+            vectors = future.result()
+            text_embeddings = list(zip([doc.page_content for doc in batch], vectors))
+            metadatas = [doc.metadata for doc in batch]
+            if vector_store is None:
+                # ✅ Load the FAISS vectorstore, or create it from the first batch, once there is something to add
+                vector_store = get_vector_store(
+                    embeddings, writable=True, base_dir=base_dir, text_embeddings=text_embeddings, metadatas=metadatas
+                )
+            else:
+                vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+            chunks_embedded += len(batch)
+            if progress:
+                progress.update(chunks_embedded=chunks_embedded)
+
+        with ThreadPoolExecutor(
+            max_workers=config.INGEST_EMBED_CONCURRENCY, thread_name_prefix="ingest-embed"
+        ) as embed_pool:
+            for batch in _batches(_iter_chunks(urls, progress), config.INGEST_EMBED_BATCH_SIZE):
+                texts = [doc.page_content for doc in batch]
+                in_flight.append((batch, embed_pool.submit(embeddings.embed_documents, texts)))
+                if len(in_flight) >= config.INGEST_EMBED_CONCURRENCY:
+                    add_oldest()
+            while in_flight:
+                add_oldest()
+
+        if vector_store is None:
+            print("❌ No documents were loaded. Check URLs.")
+            return None
 
-    # ✅ Create / load FAISS vectorstore
-    vector_store = get_vector_store(embeddings)
-    vector_store.add_documents(split_documents)
+        save_vector_store(vector_store, base_dir)
 
-    print(f"✅ Ingested {len(split_documents)} chunks from {len(urls)} PDFs.")
+    print(f"✅ Ingested {chunks_embedded} chunks from {len(urls)} PDFs.")
+    print(f"🧮 Embedding cache: {embeddings.stats()}")
     return vector_store
@@ -1,17 +1,365 @@
 from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_community.vectorstores.utils import DistanceStrategy
+from contextlib import contextmanager
+from langchain_core.documents import Document
+from typing import Iterator, List, Optional, Tuple
+import faiss
+import fcntl
+import numpy as np
 import os
+import pickle
+import shutil
+import threading
+from . import config
+from .docstore import CHUNKS_FILE, ChunkStore, PositionIds, write_chunk_store
+from .embedding_cache import CachedEmbeddings
+from .fakes import FakeEmbeddings
+from .index_factory import build_search_index, tune_search_index
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .metrics import timed_call
+from .scheduler import ScheduledEmbeddings
 
+CURRENT_MARKER = "CURRENT"
+# Exact index kept as the ingestion source of truth, and the optional trained index queries use
+FLAT_INDEX_FILE = "index.faiss"
+SEARCH_INDEX_FILE = "search.faiss"
+LEXICAL_INDEX_FILE = "lexical.pkl"
+DOCSTORE_FILE = "index.pkl"
+WRITE_LOCK_FILE = ".write.lock"
 
-def get_vector_store(embeddings=None):
-    """Return FAISS vector store."""
+# Zero-copy mapping where FAISS supports it (flat codes are otherwise copied into
+# each worker); every worker then shares one copy of the vectors in page cache
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# How queries were served by hybrid_search
+_retrieval_stats = {"lexical_fast_path": 0, "hybrid": 0, "vector_only": 0}
+_retrieval_stats_lock = threading.Lock()
+
+# Shared so ingestion and queries use one cache and one set of hit/miss counters
+_embeddings: Optional[CachedEmbeddings] = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    global _embeddings
+    # Locked so a burst of first requests opens one SQLite cache, not one each
+    with _embeddings_lock:
+        if _embeddings is None:
+            if config.UPSTREAM_BACKEND == "fake":
+                # Separate cache keys so fake vectors never mix with real ones
+                upstream, model_name = FakeEmbeddings(), f"fake-{config.FAKE_EMBEDDING_DIM}"
+            else:
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+                upstream = GoogleGenerativeAIEmbeddings(
+                    model=config.EMBEDDING_MODEL, google_api_key=os.getenv("GOOGLE_API_KEY")
+                )
+                model_name = config.EMBEDDING_MODEL
+            # Cache hits never reach the scheduler, so they cost no quota
+            _embeddings = CachedEmbeddings(
+                ScheduledEmbeddings(upstream),
+                model_name=model_name,
+                path=config.EMBEDDING_CACHE_PATH,
+                max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES,
+                batch_wait_ms=config.QUERY_EMBED_BATCH_WAIT_MS,
+                batch_size=config.QUERY_EMBED_BATCH_SIZE,
+                batch_concurrency=config.QUERY_EMBED_BATCH_CONCURRENCY,
+            )
+        return _embeddings
+
+
+def get_vector_store(embeddings=None, writable: bool = False, base_dir: str = None,
+                     text_embeddings: Optional[List[Tuple[str, List[float]]]] = None,
+                     metadatas: Optional[List[dict]] = None) -> Optional[FAISS]:
+    """
+    FAISS vector store with text_embeddings added: the persisted index when one
+    exists, otherwise a new one built from those chunks. None when there is
+    neither a persisted index nor anything to add.
+    """
     if embeddings is None:
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001", google_api_key=os.getenv("GOOGLE_API_KEY")
-        )
+        embeddings = get_embeddings()
+
+    vector_store = load_vector_store(embeddings, base_dir=base_dir, writable=writable)
+    if vector_store is not None:
+        if text_embeddings:
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+        return vector_store
+    if not text_embeddings:
+        return None
+    # Started from the first real chunks, so no placeholder takes a FAISS position
+    return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+
+
+def _relevance(vector_store: FAISS, distance: float) -> float:
+    # Gemini embeddings are unit length, so squared L2 maps to cosine as 1 - d/2
+    if vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return float(distance)
+    return 1.0 - float(distance) / 2.0
+
+
+def search_positions(vector_store: FAISS, vectors: List[List[float]], k: int) -> List[Tuple[List[int], List[float]]]:
+    """FAISS positions and relevance scores of the k nearest chunks per query vector, in one search call."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(matrix)
+    distances, ids = vector_store.index.search(matrix, k)
+    return [
+        ([int(i) for i in row if i != -1], [_relevance(vector_store, d) for i, d in zip(row, dist) if i != -1])
+        for row, dist in zip(ids, distances)
+    ]
+
+
+def docs_at(vector_store: FAISS, positions: List[int]) -> list:
+    if isinstance(vector_store.docstore, ChunkStore):
+        # Only the hits' text is read from disk, in one query
+        return [doc for doc in vector_store.docstore.fetch(positions) if doc is not None]
+    docs = []
+    for position in positions:
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+        if not isinstance(doc, str):
+            docs.append(doc)
+    return docs
+
+
+def batch_similarity_search(vector_store: FAISS, vectors: List[List[float]], k: int = 4) -> List[list]:
+    """Search many query vectors with a single FAISS call; returns documents per query."""
+    return [docs_at(vector_store, positions) for positions, _ in search_positions(vector_store, vectors, k)]
+
+
+def lexical_lookup(lexical_index: Optional[BM25Index], query: str) -> Tuple[List[int], bool]:
+    """
+    BM25 candidate positions for a query, and whether the match is strong
+    enough (every query term present, high score) to skip vector search.
+    """
+    if lexical_index is None or not config.LEXICAL_ENABLED:
+        return [], False
+    with timed_call("lexical_search"):
+        hits, coverage = lexical_index.search(query, config.RETRIEVAL_CANDIDATES)
+    strong = bool(hits) and hits[0][1] >= config.LEXICAL_FASTPATH_SCORE and coverage >= config.LEXICAL_FASTPATH_COVERAGE
+    return [p for p, _ in hits], strong
+
+
+def batch_hybrid_search(vector_store: FAISS, lexical_index: Optional[BM25Index], queries: List[str], k: int = 3,
+                        lexical: Optional[List[Tuple[List[int], bool]]] = None,
+                        vectors: Optional[List[Optional[List[float]]]] = None) -> List[Tuple[list, float]]:
+    """
+    Retrieve k chunks per query, with a relevance score for routing.
+    A strong BM25 match is served straight from the lexical index without an
+    embedding call (score 1.0); otherwise vector and lexical candidates are
+    merged with reciprocal rank fusion and the score is the best vector
+    relevance. Remaining queries are embedded and searched together.
+    `lexical` lets callers pass lexical_lookup results they already have, and
+    `vectors` query embeddings computed off this thread (None where missing).
+    """
+    lexical = lexical or [lexical_lookup(lexical_index, q) for q in queries]
+    results = [None] * len(queries)
+    for i, (positions, strong) in enumerate(lexical):
+        if strong:
+            results[i] = (docs_at(vector_store, positions[:k]), 1.0)
+            _count_retrieval("lexical_fast_path")
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    if not pending:
+        return results
+
+    given = vectors or [None] * len(queries)
+    unembedded = [i for i in pending if given[i] is None]
+    embedded = {}
+    if unembedded:
+        embeddings = vector_store.embeddings
+        with timed_call("embed_query"):
+            if len(unembedded) == 1:
+                computed = [embeddings.embed_query(queries[unembedded[0]])]
+            elif hasattr(embeddings, "embed_queries"):
+                computed = embeddings.embed_queries([queries[i] for i in unembedded])
+            else:
+                computed = [embeddings.embed_query(queries[i]) for i in unembedded]
+        embedded = dict(zip(unembedded, computed))
+    vectors = [given[i] if given[i] is not None else embedded[i] for i in pending]
+
+    candidates = config.RETRIEVAL_CANDIDATES if lexical_index is not None else k
+    with timed_call("faiss_search"):
+        hits = search_positions(vector_store, vectors, candidates)
+    for i, (positions, scores) in zip(pending, hits):
+        score = scores[0] if scores else 0.0
+        lexical_positions = lexical[i][0]
+        if lexical_positions:
+            positions = reciprocal_rank_fusion([positions, lexical_positions], k=config.RRF_K)
+            _count_retrieval("hybrid")
+        else:
+            _count_retrieval("vector_only")
+        results[i] = (docs_at(vector_store, positions[:k]), score)
+    return results
+
+
+def hybrid_search(vector_store: FAISS, lexical_index: Optional[BM25Index], query: str, k: int = 3,
+                  lexical: Optional[Tuple[List[int], bool]] = None) -> Tuple[list, float]:
+    return batch_hybrid_search(vector_store, lexical_index, [query], k, [lexical] if lexical else None)[0]
+
+
+def _count_retrieval(kind: str):
+    # Searches run on several pool threads at once
+    with _retrieval_stats_lock:
+        _retrieval_stats[kind] += 1
+
+
+def retrieval_stats() -> dict:
+    with _retrieval_stats_lock:
+        return dict(_retrieval_stats)
+
+
+def current_index_version(base_dir: str = None) -> Optional[str]:
+    """Name of the active index version, read from the CURRENT marker."""
+    base_dir = base_dir or config.INDEX_DIR
+    try:
+        with open(os.path.join(base_dir, CURRENT_MARKER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def index_write_lock(base_dir: str = None):
+    """
+    Exclusive lock for index writers across processes, so ingests started on
+    different uvicorn/gunicorn workers build on each other's versions.
+    """
+    base_dir = base_dir or config.INDEX_DIR
+    os.makedirs(base_dir, exist_ok=True)
+    with open(os.path.join(base_dir, WRITE_LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_vector_store(vector_store: FAISS, base_dir: str = None) -> str:
+    """
+    Persist the index and docstore to a new versioned directory and point
+    CURRENT at it. Readers either see the old version or the complete new one.
+    When INDEX_TYPE is not flat, a trained search index is built from the
+    exact one and saved alongside it, as is the BM25 lexical index and, with
+    COMPACT_DOCSTORE, the chunk text in a SQLite file read-only loads use
+    instead of unpickling every Document.
+    Returns the new version name.
+    """
+    base_dir = base_dir or config.INDEX_DIR
+    os.makedirs(base_dir, exist_ok=True)
+
+    current = current_index_version(base_dir)
+    number = int(current[1:]) + 1 if current else 1
+    version = f"v{number:06d}"
+    path = os.path.join(base_dir, version)
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    vector_store.save_local(tmp_path)
+    search_index = build_search_index(vector_store.index)
+    if search_index is not None:
+        faiss.write_index(search_index, os.path.join(tmp_path, SEARCH_INDEX_FILE))
+    build_lexical_index(vector_store).save(os.path.join(tmp_path, LEXICAL_INDEX_FILE))
+    if config.COMPACT_DOCSTORE:
+        write_chunk_store(_documents_in_order(vector_store), os.path.join(tmp_path, CHUNKS_FILE))
+    os.replace(tmp_path, path)
+
+    marker_tmp = os.path.join(base_dir, CURRENT_MARKER + ".tmp")
+    with open(marker_tmp, "w") as f:
+        f.write(version)
+    os.replace(marker_tmp, os.path.join(base_dir, CURRENT_MARKER))
+
+    _prune_versions(base_dir, keep=config.INDEX_KEEP_VERSIONS)
+    print(f"💾 Saved FAISS index {version} to {base_dir}")
+    return version
+
+
+def load_vector_store(embeddings, base_dir: str = None, writable: bool = False,
+                      version: Optional[str] = None) -> Optional[FAISS]:
+    """
+    Load an index version (the current one by default) without any embedding calls.
+    Read-only loads prefer the trained search index and memory-map it where the
+    index type supports it, and keep chunk text on disk when the version has a
+    compact docstore; ingestion asks for a writable copy of the exact index and
+    the full in-memory docstore it extends.
+    """
+    base_dir = base_dir or config.INDEX_DIR
+    version = version or current_index_version(base_dir)
+    if version is None:
+        return None
+
+    path = os.path.join(base_dir, version)
+    index_file = os.path.join(path, FLAT_INDEX_FILE)
+    index = None
+    if not writable:
+        search_file = os.path.join(path, SEARCH_INDEX_FILE)
+        if os.path.exists(search_file):
+            index_file = search_file
+        try:
+            index = faiss.read_index(index_file, MMAP_FLAGS)
+        except RuntimeError:
+            index = None
+    if index is None:
+        index = faiss.read_index(index_file)
+    if not writable:
+        tune_search_index(index)
+
+    chunks_file = os.path.join(path, CHUNKS_FILE)
+    if not writable and config.COMPACT_DOCSTORE and os.path.exists(chunks_file):
+        docstore = ChunkStore(chunks_file)
+        index_to_docstore_id = PositionIds(docstore.size)
+    else:
+        with open(os.path.join(path, DOCSTORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+    print(f"📂 Loaded FAISS index {version} ({index.ntotal} vectors) from {base_dir}")
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def _documents_in_order(vector_store: FAISS) -> Iterator[Document]:
+    """The store's chunks by FAISS position; missing ones as empty documents."""
+    for i in range(len(vector_store.index_to_docstore_id)):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+        yield doc if not isinstance(doc, str) else Document(page_content="")
+
+
+def build_lexical_index(vector_store: FAISS) -> BM25Index:
+    """BM25 over the store's chunks, numbered by FAISS position."""
+    return BM25Index(doc.page_content for doc in _documents_in_order(vector_store))
+
+
+def resident_bytes(base_dir: str, version: str) -> int:
+    """
+    Estimated memory a read-only load of a version takes: the files it reads
+    in full or maps, leaving out the chunk text a compact docstore keeps on disk.
+    """
+    path = os.path.join(base_dir, version)
+    names = set(os.listdir(path))
+    skipped = {CHUNKS_FILE}
+    if config.COMPACT_DOCSTORE and CHUNKS_FILE in names:
+        skipped.add(DOCSTORE_FILE)
+    if SEARCH_INDEX_FILE in names:
+        skipped.add(FLAT_INDEX_FILE)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in names - skipped)
+
+
+def load_lexical_index(version: Optional[str] = None, base_dir: str = None) -> Optional[BM25Index]:
+    base_dir = base_dir or config.INDEX_DIR
+    version = version or current_index_version(base_dir)
+    if version is None:
+        return None
+    path = os.path.join(base_dir, version, LEXICAL_INDEX_FILE)
+    return BM25Index.load(path) if os.path.exists(path) else None
+
 
-    vector_store = FAISS.from_texts(
-        ["This is a placeholder document."],
-        embedding=embeddings
+def _prune_versions(base_dir: str, keep: int):
+    versions = sorted(
+        name for name in os.listdir(base_dir)
+        if name.startswith("v") and os.path.isdir(os.path.join(base_dir, name)) and not name.endswith(".tmp")
     )
-    return vector_store
+    for name in versions[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
@@ -0,0 +1,326 @@
+"""
+Quota-aware scheduling of upstream calls (Gemini embeddings, Gemini
+generation, Tavily search). Every call is admitted through its provider's
+request and token buckets and an adaptive concurrency limit, retried with
+jittered backoff on rate limits and transient errors, and short-circuited
+by a breaker while the provider keeps failing.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+from . import config
+from .metrics import UPSTREAM_CONCURRENCY, UPSTREAM_RETRIES, UPSTREAM_WAIT_SECONDS
+
+T = TypeVar("T")
+
+GEMINI_EMBEDDING = "gemini_embedding"
+GEMINI_GENERATE = "gemini_generate"
+TAVILY = "tavily"
+
+# How often a queued caller re-checks for a free concurrency slot
+SLOT_POLL_SECONDS = 0.01
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling a provider that is rate limited or failing; maps to HTTP 503."""
+
+    def __init__(self, provider: str, reason: str, retry_after: float):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    for candidate in (getattr(error, "code", None), getattr(getattr(error, "response", None), "status_code", None)):
+        try:
+            return int(candidate)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def classify(error: Exception) -> Optional[str]:
+    """ "rate_limited", "transient" or None (not worth retrying, e.g. a bad request)."""
+    status = _status_code(error)
+    message = str(error).lower()
+    if status == 429 or type(error).__name__ == "ResourceExhausted" or "quota" in message or "rate limit" in message:
+        return "rate_limited"
+    if (status is not None and status >= 500) or isinstance(error, (TimeoutError, ConnectionError)):
+        return "transient"
+    if type(error).__name__ in ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+                                "TimeoutException", "ConnectError", "ReadError", "RemoteProtocolError"):
+        return "transient"
+    return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Rate limit of `per_minute` units with bursts of up to a tenth of the
+    minute's quota. reserve() books capacity immediately and returns how long
+    the caller must wait for it, so waiters are served in arrival order.
+    A rate of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(per_minute / 10.0, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        if self.rate <= 0 or amount == 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float):
+        """Give back (or, with a negative amount, charge) the difference from the estimate."""
+        if self.rate > 0 and amount:
+            with self._lock:
+                self.level = min(self.capacity, self.level + amount)
+
+
+class Provider:
+    """Buckets, AIMD concurrency limit and circuit breaker for one upstream."""
+
+    def __init__(self, name: str, rpm: float, tpm: float, max_concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.half_open_trial = False
+        self.calls = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    # -- admission -------------------------------------------------------
+
+    def _check_breaker(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.open_until > now:
+                raise UpstreamUnavailable(self.name, "circuit open", self.open_until - now)
+            if self.open_until and not self.half_open_trial:
+                # Cooldown over: let one trial call through, the rest fail fast until it succeeds
+                self.half_open_trial = True
+            elif self.open_until:
+                raise UpstreamUnavailable(self.name, "circuit half-open", config.UPSTREAM_BREAKER_COOLDOWN_SECONDS)
+
+    def _reserve(self, tokens: float) -> float:
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if wait > config.UPSTREAM_MAX_QUEUE_SECONDS:
+            self._unreserve(tokens)
+            raise UpstreamUnavailable(self.name, "quota exhausted", wait)
+        return wait
+
+    def _unreserve(self, tokens: float):
+        # The call never reached the provider: return its quota and free a half-open trial
+        self.requests.refund(1)
+        self.tokens.refund(tokens)
+        self._abandoned()
+
+    def _try_acquire_slot(self) -> bool:
+        with self._lock:
+            if self.in_flight < max(1, int(self.limit)):
+                self.in_flight += 1
+                UPSTREAM_CONCURRENCY.labels(self.name).set(self.in_flight)
+                return True
+            return False
+
+    def _release_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+            UPSTREAM_CONCURRENCY.labels(self.name).set(self.in_flight)
+
+    # -- outcome ---------------------------------------------------------
+
+    def _succeeded(self):
+        with self._lock:
+            self.calls += 1
+            self.failures = 0
+            self.open_until = 0.0
+            self.half_open_trial = False
+            # Additive increase: about one more slot per `limit` successful calls
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / max(self.limit, 1.0))
+
+    def _abandoned(self):
+        # A half-open trial that never reached the provider (cancelled, queued out) proves nothing
+        with self._lock:
+            self.half_open_trial = False
+
+    def _failed(self, kind: Optional[str]):
+        with self._lock:
+            self.calls += 1
+            if kind is None:
+                # The provider answered; the request itself was bad
+                self.half_open_trial = False
+                return
+            if kind == "rate_limited":
+                self.rate_limited += 1
+                # Multiplicative decrease on 429
+                self.limit = max(1.0, self.limit / 2)
+            self.failures += 1
+            if self.half_open_trial or self.failures >= config.UPSTREAM_BREAKER_FAILURES:
+                self.open_until = time.monotonic() + config.UPSTREAM_BREAKER_COOLDOWN_SECONDS
+                self.half_open_trial = False
+                print(f"⚠️ Circuit opened for {self.name} after {self.failures} failures")
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter, but never sooner than the provider asked for
+        ceiling = min(config.UPSTREAM_RETRY_MAX_SECONDS, config.UPSTREAM_RETRY_BASE_SECONDS * 2 ** attempt)
+        return max(random.uniform(0, ceiling), _retry_after(error) or 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self.open_until > time.monotonic():
+                circuit = "open"
+            else:
+                circuit = "half_open" if self.open_until else "closed"
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "rate_limited": self.rate_limited,
+                "circuit": circuit,
+            }
+
+    # -- calls -----------------------------------------------------------
+
+    def call(self, func: Callable[[], T], tokens: float = 0) -> T:
+        """Blocking call (embeddings run in worker threads)."""
+        for attempt in range(config.UPSTREAM_MAX_RETRIES + 1):
+            self._check_breaker()
+            start = time.monotonic()
+            wait = self._reserve(tokens)
+            try:
+                if wait:
+                    time.sleep(wait)
+                while not self._try_acquire_slot():
+                    time.sleep(SLOT_POLL_SECONDS)
+            except BaseException:
+                self._unreserve(tokens)
+                raise
+            UPSTREAM_WAIT_SECONDS.labels(self.name).observe(time.monotonic() - start)
+            try:
+                result = func()
+            except Exception as e:
+                kind = classify(e)
+                self._failed(kind)
+                if kind is None or attempt == config.UPSTREAM_MAX_RETRIES:
+                    raise
+                UPSTREAM_RETRIES.labels(self.name, kind).inc()
+                delay = self._backoff(attempt, e)
+            else:
+                self._succeeded()
+                return result
+            finally:
+                self._release_slot()
+            time.sleep(delay)
+
+    async def acall(self, func: Callable[[], Awaitable[T]], tokens: float = 0) -> T:
+        """Async call (generation and web search run on the event loop)."""
+        for attempt in range(config.UPSTREAM_MAX_RETRIES + 1):
+            self._check_breaker()
+            start = time.monotonic()
+            wait = self._reserve(tokens)
+            try:
+                if wait:
+                    await asyncio.sleep(wait)
+                while not self._try_acquire_slot():
+                    await asyncio.sleep(SLOT_POLL_SECONDS)
+            except BaseException:
+                # Cancelled while queued, e.g. a coalesced search whose callers all left
+                self._unreserve(tokens)
+                raise
+            UPSTREAM_WAIT_SECONDS.labels(self.name).observe(time.monotonic() - start)
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                self._abandoned()
+                raise
+            except Exception as e:
+                kind = classify(e)
+                self._failed(kind)
+                if kind is None or attempt == config.UPSTREAM_MAX_RETRIES:
+                    raise
+                UPSTREAM_RETRIES.labels(self.name, kind).inc()
+                delay = self._backoff(attempt, e)
+            else:
+                self._succeeded()
+                return result
+            finally:
+                self._release_slot()
+            await asyncio.sleep(delay)
+
+    def settle_tokens(self, estimated: float, actual: float):
+        """Correct the token bucket once the provider reports real usage."""
+        self.tokens.refund(estimated - actual)
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings whose upstream calls go through the gemini_embedding provider."""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    @staticmethod
+    def _tokens(texts: List[str]) -> int:
+        return sum(len(t) for t in texts) // 4 + 1
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        return get_provider(GEMINI_EMBEDDING).call(
+            lambda: self.embeddings.embed_documents(texts, **kwargs), tokens=self._tokens(texts)
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_provider(GEMINI_EMBEDDING).call(lambda: self.embeddings.embed_query(text), tokens=self._tokens([text]))
+
+    async def aembed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        return await get_provider(GEMINI_EMBEDDING).acall(
+            lambda: self.embeddings.aembed_documents(texts, **kwargs), tokens=self._tokens(texts)
+        )
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await get_provider(GEMINI_EMBEDDING).acall(
+            lambda: self.embeddings.aembed_query(text), tokens=self._tokens([text])
+        )
+
+
+_providers: Dict[str, Provider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name: str) -> Provider:
+    with _providers_lock:
+        if name not in _providers:
+            rpm, tpm = config.UPSTREAM_QUOTAS[name]
+            _providers[name] = Provider(name, rpm, tpm, config.UPSTREAM_MAX_CONCURRENCY)
+        return _providers[name]
+
+
+def scheduler_stats() -> dict:
+    with _providers_lock:
+        providers = dict(_providers)
+    return {name: provider.stats() for name, provider in providers.items()}
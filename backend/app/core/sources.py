@@ -0,0 +1,52 @@
+"""
+Which URLs an ingest may fetch. /api/ingest is unauthenticated and ingested
+text is served back in answers, so only http(s) URLs on public hosts are
+accepted: no server-local paths, and no loopback, private, link-local or
+otherwise non-global addresses. The literal host is checked when the job is
+submitted; every resolved address and every redirect hop is checked again
+at download time. synthetic:// URLs are only accepted with the fake backend.
+"""
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+
+from . import config
+from .fakes import SYNTHETIC_SCHEME
+
+ALLOWED_SCHEMES = ("http", "https")
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def validate_source_url(url: str) -> str:
+    """The URL when an ingest may fetch it; raises ValueError otherwise. Does not resolve the host."""
+    if config.UPSTREAM_BACKEND == "fake" and url.startswith(SYNTHETIC_SCHEME):
+        return url
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ALLOWED_SCHEMES or not parts.hostname:
+        raise ValueError(f"Unsupported document URL {url!r}: only http(s) URLs can be ingested")
+    host = parts.hostname.lower()
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ValueError(f"Document URL {url!r} points at a local host")
+    try:
+        public = _is_public(host)
+    except ValueError:
+        return url  # A hostname, checked when it is resolved
+    if not public:
+        raise ValueError(f"Document URL {url!r} points at a non-public address")
+    return url
+
+
+def check_resolved_host(url: str):
+    """Raise ValueError unless every address the URL's host resolves to is public."""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme.lower() == "https" else 80)
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {parts.hostname!r}: {e}")
+    if not all(_is_public(address) for address in addresses):
+        raise ValueError(f"Document URL {url!r} resolves to a non-public address")
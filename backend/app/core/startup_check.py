@@ -0,0 +1,174 @@
+"""
+Import-time and startup-time budget check for the backend.
+
+    python -m app.core.startup_check --import-budget-ms 2500 --ready-budget-ms 5000
+
+Each measurement runs in a fresh interpreter with the fake upstream backends
+and exits non-zero when startup has regressed:
+  import  median wall time of `import app.main`, which must also leave the
+          heavy dependencies in LAZY_MODULES unimported
+  ready   launch of a uvicorn worker until GET / answers
+  warm    launch until the background warm-up (runtime, default collection,
+          SymPy) has finished, read from /metrics
+The default collection is empty unless --index-dir points at an ingested index.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+# Only the ingest path, the live backends or the first solved problem may import these
+LAZY_MODULES = (
+    "google.generativeai",
+    "langchain_google_genai",
+    "langgraph",
+    "langchain_community.document_loaders",
+    "langchain_text_splitters",
+    "pypdf",
+    "sympy",
+)
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _environment(work_dir: str, index_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update(
+        UPSTREAM_BACKEND="fake",
+        INDEX_DIR=index_dir,
+        INGEST_JOBS_DIR=os.path.join(work_dir, "jobs"),
+        EMBEDDING_CACHE_PATH=os.path.join(work_dir, "embedding_cache.sqlite"),
+        BACKGROUND_WARMUP="true",
+        PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")])),
+    )
+    return env
+
+
+def measure_import(env: dict, runs: int) -> dict:
+    samples, loaded = [], set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE % (LAZY_MODULES,)],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return {"seconds": statistics.median(samples), "samples": samples, "loaded": sorted(loaded)}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str) -> str:
+    with urllib.request.urlopen(url, timeout=1) as response:
+        return response.read().decode()
+
+
+def _warmup_seconds(metrics: str) -> float:
+    for line in metrics.splitlines():
+        if line.startswith("math_agent_warmup_seconds "):
+            return float(line.split()[1])
+    return 0.0
+
+
+def measure_startup(env: dict, timeout: float) -> dict:
+    """Seconds from launching a uvicorn worker until it serves requests, and until it is warm."""
+    base_url = f"http://127.0.0.1:{_free_port()}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", base_url.rsplit(":", 1)[1], "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {"ready_seconds": None, "warm_seconds": None}
+    try:
+        while time.perf_counter() - start < timeout and server.poll() is None:
+            try:
+                if result["ready_seconds"] is None:
+                    _get(f"{base_url}/")
+                    result["ready_seconds"] = time.perf_counter() - start
+                if _warmup_seconds(_get(f"{base_url}/metrics")) > 0:
+                    result["warm_seconds"] = time.perf_counter() - start
+                    break
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.02)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return result
+
+
+def check(results: dict, import_budget_ms: float, ready_budget_ms: float, warm_budget_ms: float) -> list:
+    failures = []
+    if results["import"]["loaded"]:
+        failures.append(f"import app.main loaded {', '.join(results['import']['loaded'])}")
+    for name, seconds, budget_ms in (
+        ("import", results["import"]["seconds"], import_budget_ms),
+        ("ready", results["startup"]["ready_seconds"], ready_budget_ms),
+        ("warm", results["startup"]["warm_seconds"], warm_budget_ms),
+    ):
+        if seconds is None:
+            failures.append(f"{name}: not reached")
+        elif seconds * 1000 > budget_ms:
+            failures.append(f"{name}: {seconds * 1000:.0f} ms over the {budget_ms:.0f} ms budget")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--import-budget-ms", type=float, default=2500)
+    parser.add_argument("--ready-budget-ms", type=float, default=5000)
+    parser.add_argument("--warm-budget-ms", type=float, default=20000)
+    parser.add_argument("--runs", type=int, default=3, help="import measurements; the median is checked")
+    parser.add_argument("--index-dir", help="index to load during warm-up (default: an empty one)")
+    parser.add_argument("--out", help="also write the measurements as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = _environment(work_dir, args.index_dir or os.path.join(work_dir, "index"))
+        results = {
+            "import": measure_import(env, args.runs),
+            "startup": measure_startup(env, timeout=max(args.ready_budget_ms, args.warm_budget_ms) / 1000 * 2),
+        }
+
+    startup = results["startup"]
+    print(f"⏱️ import app.main {results['import']['seconds'] * 1000:.0f} ms (median of {args.runs})")
+    for name in ("ready", "warm"):
+        seconds = startup[f"{name}_seconds"]
+        print(f"⏱️ {name} {'not reached' if seconds is None else f'{seconds * 1000:.0f} ms'}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = check(results, args.import_budget_ms, args.ready_budget_ms, args.warm_budget_ms)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Startup within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import asyncio
+import math
+import multiprocessing
+import re
+import signal
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from . import config
+
+# SymPy only ever runs in the solver worker processes (see SolverPool), so the
+# API process never imports it
+MAX_EXPRESSION_LENGTH = 200
+MAX_EXPONENT = 100
+WORKER_POLL_SECONDS = 0.01
+WARM_UP_PROBLEM = "x + 1 = 2"
+
+FUNCTIONS = {"sin", "cos", "tan", "log", "ln", "sqrt", "exp", "pi", "e", "abs"}
+UNICODE_MATH = str.maketrans({
+    "²": "^2", "³": "^3", "⁴": "^4", "×": "*", "·": "*", "÷": "/", "−": "-", "–": "-", "π": "pi",
+})
+
+# Leading instruction -> operation; the rest of the query is the expression
+OPERATIONS = [
+    (r"(?:find\s+the\s+)?(?:derivative|differentiate)(?:\s+of)?", "diff"),
+    (r"(?:find\s+the\s+)?(?:integral|integrate)(?:\s+of)?", "integrate"),
+    (r"factor(?:ise|ize)?", "factor"),
+    (r"expand", "expand"),
+    (r"simplify", "simplify"),
+    (r"(?:solve|find\s+\w+\s+(?:if|when|in))", "solve"),
+    (r"(?:what\s+is|what's|evaluate|compute|calculate)", "evaluate"),
+]
+QUESTION_PREFIX = re.compile(r"^(?:what\s+is|what's|find|compute|calculate)\s+the\s+(?=derivative|integral)")
+FILLER = re.compile(
+    r"^(?:the\s+)?(?:(?:quadratic|linear|cubic|polynomial)\s+)?(?:equation|expression)?\s*:?\s*", re.I
+)
+MATH_ONLY = re.compile(r"^[0-9a-z+\-*/^().=,\s]+$")
+
+
+def extract_problem(query: str) -> Optional[Tuple[str, str]]:
+    """
+    (operation, expression) when the query is a plain algebra/arithmetic
+    problem this module can handle, else None. Deliberately strict: anything
+    with words other than single-letter variables and known functions is left
+    to the LLM.
+    """
+    text = query.translate(UNICODE_MATH).strip().lower()
+    text = re.sub(r"\s+for\s+[a-z]\s*$", "", text.rstrip("?.! "))
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        return None
+
+    text = QUESTION_PREFIX.sub("", text)
+    operation = None
+    for pattern, name in OPERATIONS:
+        match = re.match(pattern + r"\b\s*", text)
+        if match:
+            operation, text = name, FILLER.sub("", text[match.end():]).strip()
+            break
+
+    if not text or not MATH_ONLY.match(text):
+        return None
+    # Without an explicit instruction, only take things that contain numbers
+    if operation in (None, "evaluate") and not re.search(r"[0-9]", text):
+        return None
+    words = set(re.findall(r"[a-z]+", text))
+    # Implicit multiplication makes "xy" two symbols; longer words are prose
+    if any(len(w) > 2 and w not in FUNCTIONS for w in words):
+        return None
+    if operation is None:
+        operation = "solve" if "=" in text else "evaluate"
+    return operation, text
+
+
+def _size(expr) -> Tuple[float, int]:
+    """
+    Upper bounds on the polynomial degree (inf when not polynomial) and the
+    number of terms once fully expanded, read off the unevaluated tree
+    without expanding anything.
+    """
+    import sympy
+
+    if expr.is_Symbol:
+        return 1, 1
+    if expr.is_number:
+        return 0, 1
+    if isinstance(expr, sympy.Add):
+        sizes = [_size(arg) for arg in expr.args]
+        return max(d for d, _ in sizes), sum(t for _, t in sizes)
+    if isinstance(expr, sympy.Mul):
+        sizes = [_size(arg) for arg in expr.args]
+        return sum(d for d, _ in sizes), math.prod(t for _, t in sizes)
+    if isinstance(expr, sympy.Pow) and expr.exp.is_Integer:
+        degree, terms = _size(expr.base)
+        n = abs(int(expr.exp))
+        # Monomials of degree n in `terms` variables
+        return degree * n, math.comb(terms + n - 1, n) if terms > 1 else 1
+    # Functions, symbolic or fractional exponents: not a polynomial in the free symbols
+    return math.inf, 1
+
+
+def _parse(text: str, max_degree: float = math.inf):
+    import sympy
+    from sympy.parsing.sympy_parser import (
+        convert_xor,
+        implicit_multiplication_application,
+        parse_expr,
+        standard_transformations,
+    )
+
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+    # Check sizes on the unevaluated tree so 9^9^9 or (x+y+z+w)^60 is rejected before it is computed
+    raw = parse_expr(text, transformations=transformations, evaluate=False)
+    for power in raw.atoms(sympy.Pow):
+        exponent = power.exp
+        if exponent.is_number and (exponent.atoms(sympy.Pow) or abs(exponent) > MAX_EXPONENT):
+            raise ValueError("exponent too large")
+    degree, terms = _size(raw)
+    if terms > config.SYMBOLIC_MAX_TERMS:
+        raise ValueError("expression too large")
+    if degree > max_degree:
+        raise ValueError("degree too high")
+    expr = parse_expr(text, transformations=transformations, evaluate=True)
+    if not _finite(expr):
+        raise ValueError("undefined")
+    return expr
+
+
+def _finite(expr) -> bool:
+    """False for results like 1/0 (zoo), 0/0 (nan) or infinities, which the LLM should explain instead."""
+    import sympy
+
+    return not expr.has(sympy.zoo, sympy.nan, sympy.oo, -sympy.oo)
+
+
+def _show(expr) -> str:
+    import sympy
+
+    return re.sub(r"\bI\b", "i", sympy.sstr(expr).replace("**", "^"))
+
+
+def _format_solutions(symbol, solutions) -> str:
+    return ", ".join(f"{symbol} = {_show(s)}" for s in solutions)
+
+
+def _solve(text: str) -> Optional[str]:
+    import sympy
+
+    if text.count("=") != 1:
+        return None
+    # Polynomial (or rational) equations of low degree only: higher degrees send
+    # SymPy into slow root isolation, and periodic equations have infinitely many solutions
+    lhs, rhs = (_parse(side, max_degree=config.SYMBOLIC_MAX_DEGREE) for side in text.split("="))
+    expr = sympy.expand(lhs - rhs)
+    symbols = sorted(expr.free_symbols, key=str)
+    if len(symbols) != 1:
+        return None
+    x = symbols[0]
+    solutions = sympy.solve(sympy.Eq(expr, 0), x)
+    if not all(_finite(s) for s in solutions):
+        return None
+
+    steps = [f"1. Move every term to one side: {_show(expr)} = 0"]
+    poly = sympy.Poly(expr, x) if expr.is_polynomial(x) else None
+    if poly is not None and poly.degree() == 1:
+        a, b = poly.all_coeffs()
+        steps.append(f"2. Isolate {x}: {x} = {_show(-b)}/{_show(a)}")
+    elif poly is not None and poly.degree() == 2:
+        a, b, c = poly.all_coeffs()
+        discriminant = b ** 2 - 4 * a * c
+        steps.append(f"2. Identify coefficients: a = {a}, b = {b}, c = {c}")
+        steps.append(f"3. Discriminant: b² - 4ac = {_show(discriminant)}")
+        factored = sympy.factor(expr)
+        if factored != expr:
+            steps.append(f"4. Factor: {_show(factored)} = 0")
+        else:
+            steps.append(f"4. Quadratic formula: {x} = (-b ± √(b² - 4ac)) / 2a")
+    else:
+        factored = sympy.factor(expr)
+        if factored != expr:
+            steps.append(f"2. Factor: {_show(factored)} = 0")
+
+    if not solutions:
+        steps.append(f"{len(steps) + 1}. There is no solution.")
+    else:
+        steps.append(f"{len(steps) + 1}. Solve for {x}: {_format_solutions(x, solutions)}")
+    return "\n".join(steps) + f"\n\n**Answer:** {_format_solutions(x, solutions) or 'no solution'}"
+
+
+def _transform(operation: str, text: str) -> Optional[str]:
+    import sympy
+
+    expr = _parse(text)
+    symbols = sorted(expr.free_symbols, key=str)
+    if operation in ("diff", "integrate"):
+        if len(symbols) != 1:
+            return None
+        x = symbols[0]
+        if operation == "diff":
+            result = sympy.diff(expr, x)
+            if not _finite(result):
+                return None
+            return f"1. Differentiate {_show(expr)} with respect to {x}.\n\n**Answer:** d/d{x} = {_show(result)}"
+        result = sympy.integrate(expr, x)
+        if result.has(sympy.Integral) or not _finite(result):
+            return None
+        return f"1. Integrate {_show(expr)} with respect to {x}.\n\n**Answer:** {_show(result)} + C"
+
+    if operation == "evaluate":
+        if symbols:
+            return None
+        exact = sympy.nsimplify(expr) if expr.is_Float else sympy.simplify(expr)
+        if not _finite(exact):
+            return None
+        answer = _show(exact)
+        if not exact.is_Integer:
+            answer += f" ≈ {sympy.N(exact, 10)}"
+        return f"1. Evaluate {text}.\n\n**Answer:** {answer}"
+
+    result = {"factor": sympy.factor, "expand": sympy.expand, "simplify": sympy.simplify}[operation](expr)
+    if not _finite(result):
+        return None
+    return f"1. {operation.capitalize()} {_show(expr)}.\n\n**Answer:** {_show(result)}"
+
+
+def try_solve(query: str) -> Optional[str]:
+    """
+    Exact, step-by-step answer for plain algebra and arithmetic, or None when
+    the query should go through retrieval and the LLM instead.
+    """
+    problem = extract_problem(query)
+    if problem is None:
+        return None
+    operation, text = problem
+    try:
+        if operation == "solve":
+            if "=" not in text:
+                return None
+            return _solve(text)
+        if "=" in text:
+            return None
+        return _transform(operation, text)
+    except Exception:
+        return None
+
+
+def _serve(conn):
+    """Solver worker: answers try_solve requests from the API process until the pipe closes."""
+    # Ctrl-C is for the API process, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import sympy  # noqa: F401  (loaded before the first request, not during it)
+
+    while True:
+        try:
+            query = conn.recv()
+        except EOFError:
+            return
+        conn.send(try_solve(query))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn,), name="sympy-solver", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=1)  # Reap it; SIGKILL takes effect at once
+        self.conn.close()
+
+
+async def _receive(conn):
+    # Wait for the worker's reply without tying up a thread
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(conn.fileno(), lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_reader(conn.fileno())
+    return conn.recv()
+
+
+class SolverPool:
+    """
+    Runs try_solve in separate worker processes. SymPy's big-integer work
+    holds the GIL, so in a thread it would stall the event loop, and a thread
+    cannot be stopped once a timeout has given up on it. A worker that
+    overruns the timeout (or whose caller is cancelled) is killed and
+    replaced on demand; waiting for a free worker counts against the timeout.
+    """
+
+    def __init__(self, workers: int, timeout_seconds: float):
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.killed = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: List[_Worker] = []
+        self._started = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> Optional[_Worker]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._started >= self.workers:
+                return None
+            self._started += 1
+        return self._spawn()
+
+    def _spawn(self) -> _Worker:
+        # The caller has already counted the worker in _started
+        try:
+            return _Worker(self._context)
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+
+    def _checkin(self, worker: _Worker):
+        with self._lock:
+            self._idle.append(worker)
+
+    def _discard(self, worker: _Worker):
+        worker.kill()
+        with self._lock:
+            self._started -= 1
+            self.killed += 1
+
+    def start(self):
+        """Start every worker and wait until each has SymPy loaded (blocking; for the startup warm-up)."""
+        while True:
+            with self._lock:
+                if self._started >= self.workers:
+                    return
+                self._started += 1
+            worker = self._spawn()
+            try:
+                worker.conn.send(WARM_UP_PROBLEM)
+                worker.conn.recv()
+            except (EOFError, OSError):
+                self._discard(worker)
+                return
+            self._checkin(worker)
+
+    async def solve(self, query: str) -> Optional[str]:
+        """try_solve in a worker, or None when it fails or misses the timeout."""
+        deadline = time.monotonic() + self.timeout_seconds
+        worker = self._checkout()
+        while worker is None:
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+            worker = self._checkout()
+        try:
+            worker.conn.send(query)
+            answer = await asyncio.wait_for(_receive(worker.conn), max(deadline - time.monotonic(), 0))
+        except (asyncio.TimeoutError, EOFError, OSError):
+            self._discard(worker)
+            return None
+        except asyncio.CancelledError:
+            self._discard(worker)
+            raise
+        self._checkin(worker)
+        return answer
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+        for worker in idle:
+            worker.kill()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self._started, "idle": len(self._idle), "killed": self.killed}
+
+
+_solver_pool: Optional[SolverPool] = None
+_solver_pool_lock = threading.Lock()
+
+
+def get_solver_pool() -> SolverPool:
+    global _solver_pool
+    with _solver_pool_lock:
+        if _solver_pool is None:
+            _solver_pool = SolverPool(config.SYMBOLIC_WORKERS, config.SYMBOLIC_TIMEOUT_SECONDS)
+        return _solver_pool
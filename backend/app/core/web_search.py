@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+
+from . import config
+from .metrics import timed_call
+from .scheduler import TAVILY, get_provider
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip("?.! ")
+
+
+class WebSearchClient:
+    """
+    Shared Tavily client: one keep-alive connection pool, a TTL cache of
+    normalized query -> snippets (in memory, optionally backed by SQLite),
+    and coalescing so identical in-flight searches make a single request.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, max_results: int = None,
+                 ttl_seconds: float = None, max_entries: int = None, cache_path: str = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_key = api_key or os.getenv("TAVILY_API_KEY")
+        self.max_results = max_results or config.WEB_SEARCH_MAX_RESULTS
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.WEB_SEARCH_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or config.WEB_SEARCH_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (snippets, created_at)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        # Callers awaiting each in-flight task; the last one to be cancelled cancels the task
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+        # Lets UPSTREAM_BACKEND=fake answer searches locally through the same cache and pool
+        self._transport = transport
+        self._disk = None
+        self._disk_lock = threading.Lock()
+
+        cache_path = cache_path if cache_path is not None else config.WEB_SEARCH_CACHE_PATH
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self._disk = sqlite3.connect(cache_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "key TEXT PRIMARY KEY, snippets TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    def _http(self) -> httpx.AsyncClient:
+        # The pool belongs to the loop that created it (scripts may use asyncio.run)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=config.WEB_SEARCH_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=config.WEB_SEARCH_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.WEB_SEARCH_MAX_CONNECTIONS,
+                ),
+                transport=self._transport,
+            )
+            self._client_loop = loop
+        return self._client
+
+    def _cached(self, key: str) -> Optional[List[str]]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if now - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                return entry[0]
+            del self._memory[key]
+
+        if self._disk is not None:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT snippets, created_at FROM searches WHERE key = ?", (key,)
+                ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                snippets = json.loads(row[0])
+                self._remember(key, snippets, row[1], persist=False)
+                return snippets
+        return None
+
+    def _remember(self, key: str, snippets: List[str], created_at: float, persist: bool = True):
+        self._memory[key] = (snippets, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        if persist and self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO searches (key, snippets, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(snippets), created_at),
+                )
+                self._disk.execute(
+                    "DELETE FROM searches WHERE created_at < ?", (created_at - self.ttl_seconds,)
+                )
+                self._disk.commit()
+
+    async def _fetch(self, query: str, key: str) -> List[str]:
+        async def post() -> httpx.Response:
+            response = await self._http().post(
+                config.TAVILY_API_URL,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json={"query": query, "max_results": self.max_results},
+            )
+            # Raised inside the scheduled call so 429s and 5xx are retried
+            response.raise_for_status()
+            return response
+
+        try:
+            with timed_call("tavily"):
+                response = await get_provider(TAVILY).acall(post)
+            snippets = [r["content"] for r in response.json().get("results", [])]
+            self._remember(key, snippets, time.time())
+            return snippets
+        finally:
+            # A cancelled fetch may already have been replaced by a new one
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+    async def search(self, query: str) -> List[str]:
+        key = normalize_query(query)
+        snippets = self._cached(key)
+        if snippets is not None:
+            self.hits += 1
+            return snippets
+
+        task = self._in_flight.get(key)
+        if task is None or task.cancelling():
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(query, key))
+            # Mark failures as retrieved even if every caller has gone away
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._in_flight[key] = task
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel a request others are waiting on
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Every caller has gone away: stop the upstream request instead of finishing it for no one.
+                    # Unlisted first, so a caller arriving while it unwinds starts a fresh request.
+                    if self._in_flight.get(key) is task:
+                        del self._in_flight[key]
+                    task.cancel()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / total, 4) if total else 0.0,
+            "entries": len(self._memory),
+        }
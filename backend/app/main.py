@@ -1,11 +1,56 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .api.endpoints import router
+from .core import config
+from .core.agent import get_runtime, warm_up
+from .core.metrics import WARMUP_SECONDS, mark_worker_exited, render_metrics
+from .core.symbolic import get_solver_pool
+
+
+async def _warm_up_in_background():
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(warm_up)
+    except Exception as e:
+        # Not fatal: requests build the runtime and load collections on demand
+        print(f"⚠️ Startup warm-up failed: {e}")
+        return
+    elapsed = time.perf_counter() - start
+    WARMUP_SECONDS.set(elapsed)
+    print(f"🔥 Warmed up in {elapsed:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the compiled graph and upstream clients once per worker and load the
+    # default collection (memory-mapped, so workers share its pages); other
+    # collections load on first use. In the background by default, so the
+    # worker accepts connections without waiting for Gemini, FAISS and SymPy.
+    warmup = None
+    if config.BACKGROUND_WARMUP:
+        warmup = asyncio.create_task(_warm_up_in_background())
+    else:
+        start = time.perf_counter()
+        warm_up()
+        WARMUP_SECONDS.set(time.perf_counter() - start)
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    runtime = get_runtime()
+    if runtime is not None:
+        await runtime.search_tool.aclose()
+    get_solver_pool().close()
+    mark_worker_exited()
+
 
 app = FastAPI(
     title="Math Agent",
     description="An Agentic-RAG system for solving math problems.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -27,3 +72,9 @@ app.include_router(router, prefix="/api")
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Math Agent API!"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
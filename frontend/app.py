@@ -1,11 +1,9 @@
 import streamlit as st
 import requests
 import json
-import os
-import time
 from datetime import datetime
 
-API_URL = os.getenv('API_URL', 'https://math-routing-planet-backend.onrender.com')
+from client import API_URL, MathAgentClient
 
 # --- Enhanced Page Configuration ---
 st.set_page_config(
@@ -361,25 +359,50 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+
+@st.cache_resource
+def get_client():
+    """One pooled client (and response cache) shared by every session of this app."""
+    return MathAgentClient(API_URL)
+
+
+@st.cache_data(ttl=15, show_spinner=False)
+def fetch_stats():
+    """Live backend stats for the sidebar; None when the API is unreachable."""
+    try:
+        return get_client().stats()
+    except requests.exceptions.RequestException:
+        return None
+
+
+def format_seconds(value):
+    return f"{value:.2f}s" if value is not None else "n/a"
+
+
 # --- Sidebar with Enhanced Features ---
 with st.sidebar:
     st.markdown("### 🚀 System Status", unsafe_allow_html=True)
+
+    stats = fetch_stats()
+    latency = (stats or {}).get("latency") or {}
+    api_online = stats is not None
+    status_color = "#4ecdc4" if api_online else "#ff6b6b"
     
     # System metrics with enhanced styling
-    st.markdown("""
+    st.markdown(f"""
     <div class="metric-card">
         <div style="display: flex; justify-content: space-between; margin-bottom: 15px;">
             <div style="text-align: center; flex: 1;">
-                <div style="color: #4ecdc4; font-size: 24px; font-weight: bold;">🟢</div>
+                <div style="color: {status_color}; font-size: 24px; font-weight: bold;">{"🟢" if api_online else "🔴"}</div>
                 <div style="color: white; font-size: 14px; margin: 5px 0; font-weight: bold;">API Status</div>
-                <div style="color: #4ecdc4; font-size: 16px; font-weight: bold;">Online</div>
-                <div style="color: rgba(255,255,255,0.7); font-size: 12px;">100% uptime</div>
+                <div style="color: {status_color}; font-size: 16px; font-weight: bold;">{"Online" if api_online else "Offline"}</div>
+                <div style="color: rgba(255,255,255,0.7); font-size: 12px;">{latency.get("requests", 0)} recent queries</div>
             </div>
             <div style="text-align: center; flex: 1;">
                 <div style="color: #4ecdc4; font-size: 24px; font-weight: bold;">⚡</div>
                 <div style="color: white; font-size: 14px; margin: 5px 0; font-weight: bold;">Response Time</div>
-                <div style="color: #4ecdc4; font-size: 16px; font-weight: bold;">~2.3s</div>
-                <div style="color: rgba(255,255,255,0.7); font-size: 12px;">-0.5s faster</div>
+                <div style="color: #4ecdc4; font-size: 16px; font-weight: bold;">{format_seconds(latency.get("p50"))}</div>
+                <div style="color: rgba(255,255,255,0.7); font-size: 12px;">p50 · p95 {format_seconds(latency.get("p95"))}</div>
             </div>
         </div>
     </div>
@@ -457,26 +480,36 @@ if solve_button:
         status_text = st.empty()
         
         try:
-            # Simulate processing steps
-            for i, step in enumerate([
-                "🔍 Analyzing query structure...",
-                "🧠 Processing with AI agents...",
-                "📚 Retrieving relevant information...",
-                "⚡ Generating intelligent response...",
-                "✨ Finalizing results..."
-            ]):
-                status_text.markdown(f"**{step}**")
-                progress_bar.progress((i + 1) * 20)
-                time.sleep(0.3)
-            
-            # API call
-            response = requests.post(
-                f"{API_URL}/api/query", 
-                json={"query": query}, 
-                timeout=300
-            )
-            response.raise_for_status()
-            result = response.json()
+            # Stream node transitions and answer tokens as they arrive
+            node_steps = {
+                "symbolic": "🧮 Trying an exact symbolic solution...",
+                "retrieve": "📚 Retrieving relevant information...",
+                "web_search": "🌐 Searching the web...",
+                "generate": "⚡ Generating intelligent response...",
+            }
+            status_text.markdown("**🔍 Analyzing query structure...**")
+            answer_placeholder = st.empty()
+            streamed_answer = ""
+            result = {}
+            completed_nodes = 0
+
+            # A repeated question is answered from the client cache as a single "done" event
+            for event_name, data in get_client().stream(query):
+                if event_name == "node":
+                    if data["status"] == "start":
+                        status_text.markdown(f"**{node_steps.get(data['node'], data['node'])}**")
+                    else:
+                        completed_nodes += 1
+                        progress_bar.progress(min(completed_nodes * 25, 100))
+                elif event_name == "token":
+                    streamed_answer += data["text"]
+                    answer_placeholder.markdown(streamed_answer)
+                elif event_name == "done":
+                    result = data
+                elif event_name == "error":
+                    raise RuntimeError(data["detail"])
+
+            answer_placeholder.empty()
             
             # Clear progress indicators
             progress_bar.empty()
@@ -522,6 +555,14 @@ if solve_button:
                     if result.get('amount'):
                         st.markdown("#### 💰 Amount")
                         st.markdown(f"**{result['amount']}**")
+
+                timings = result.get('timings')
+                if timings:
+                    st.markdown(f"#### ⏱️ Response Time: {timings['total_ms'] / 1000:.2f}s")
+                    for name, ms in {**timings.get('nodes', {}), **timings.get('calls', {})}.items():
+                        st.markdown(f"**{name.replace('_', ' ').title()}:** {ms:.0f} ms")
+                if result.get('context_tokens_saved'):
+                    st.markdown(f"**Context tokens saved:** {result['context_tokens_saved']}")
             
             with tab2:
                 if result.get('justification'):
@@ -0,0 +1,279 @@
+"""
+Python client for the Math Agent API, shared by the Streamlit app and batch
+scripts. One keep-alive session pools connections to the backend, identical
+queries are answered from a bounded in-process cache, and failed round trips
+(connection errors, 429 and 5xx) are retried with jittered backoff that
+honours Retry-After.
+
+Usage from a script:
+    python client.py "Solve x^2 - 5x + 6 = 0"
+    python client.py --batch questions.txt --collection calculus > answers.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = os.getenv('API_URL', 'https://math-routing-planet-backend.onrender.com')
+CACHE_MAX_ENTRIES = int(os.getenv('API_CACHE_MAX_ENTRIES', '256'))
+CACHE_TTL_SECONDS = float(os.getenv('API_CACHE_TTL_SECONDS', '600'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ResponseCache:
+    """Least recently used responses, each kept for at most ttl_seconds."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl_seconds:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _query_key(query: str, collections: Optional[List[str]]) -> Tuple[str, tuple]:
+    # Mirrors the backend's web_search.normalize_query: case, whitespace and trailing "?.!" do not matter
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip("?.! "), tuple(collections or ())
+
+
+def _cacheable(result: dict) -> dict:
+    # Timings describe the request that produced the answer, not a later cache hit
+    return {k: v for k, v in result.items() if k != 'timings'}
+
+
+class MathAgentClient:
+    """
+    Thread-safe; create one per process (the Streamlit app keeps one in
+    st.cache_resource) so every call reuses the pooled connections.
+    """
+
+    def __init__(self, base_url: str = API_URL, timeout: float = 300, retries: int = 3,
+                 backoff_seconds: float = 0.5, pool_size: int = 10, cache: Optional[ResponseCache] = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.cache = cache or ResponseCache()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # -- transport -------------------------------------------------------
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        delay = random.uniform(0, self.backoff_seconds * 2 ** attempt)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get('Retry-After', 0)))
+            except ValueError:
+                pass
+        return delay
+
+    def _request(self, method: str, path: str, retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """Send a request, retrying connection failures and retryable statuses; raises HTTPError otherwise."""
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(retries + 1):
+            response = None
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    response.raise_for_status()
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+                # Not ReadTimeout: the backend may still be working on a query that is slow, not lost
+                if attempt == retries:
+                    raise
+            delay = self._delay(attempt, response)
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+    @staticmethod
+    def _collections_field(collections: Optional[List[str]]) -> dict:
+        return {'collections': collections} if collections else {}
+
+    # -- queries ---------------------------------------------------------
+
+    def cached_query(self, query: str, collections: Optional[List[str]] = None) -> Optional[dict]:
+        return self.cache.get(_query_key(query, collections))
+
+    def query(self, query: str, collections: Optional[List[str]] = None, use_cache: bool = True) -> dict:
+        """POST /api/query; identical re-submits are served from the cache."""
+        key = _query_key(query, collections)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        result = self._request(
+            'POST', '/api/query', json={'query': query, **self._collections_field(collections)}
+        ).json()
+        self.cache.put(key, _cacheable(result))
+        return result
+
+    def stream(self, query: str, collections: Optional[List[str]] = None,
+               use_cache: bool = True) -> Iterator[Tuple[str, dict]]:
+        """
+        (event, data) pairs from POST /api/query/stream: "node", "token", then
+        "done" (or "error"). A cached answer is yielded as a single "done" event.
+        Only opening the stream is retried; a stream that fails midway raises.
+        """
+        key = _query_key(query, collections)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield 'done', cached
+                return
+        response = self._request(
+            'POST', '/api/query/stream', json={'query': query, **self._collections_field(collections)}, stream=True
+        )
+        with response:
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[len('event:'):].strip()
+                elif line.startswith('data:'):
+                    data = json.loads(line[len('data:'):].strip())
+                    if event == 'done':
+                        self.cache.put(key, _cacheable(data))
+                    yield event, data
+
+    def batch(self, queries: List[str], collections: Optional[List[str]] = None,
+              ordered: bool = True) -> Iterator[dict]:
+        """
+        Results from POST /api/query/batch as they arrive, one
+        {"index", "query", "answer" | "error"} dict per query. Queries already
+        cached are answered locally and left out of the request.
+        """
+        results = {}
+        pending = []
+        for index, query in enumerate(queries):
+            cached = self.cache.get(_query_key(query, collections))
+            if cached is not None:
+                results[index] = {'index': index, 'query': query, **cached}
+            else:
+                pending.append(index)
+
+        def local_up_to(limit):
+            # Cached results go out in input order around the streamed ones
+            while results and min(results) < limit:
+                yield results.pop(min(results))
+
+        if not ordered:
+            yield from local_up_to(len(queries))
+        if pending:
+            response = self._request(
+                'POST', '/api/query/batch',
+                json={'queries': [queries[i] for i in pending], 'ordered': ordered,
+                      **self._collections_field(collections)},
+                stream=True,
+            )
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    if 'index' not in item:
+                        # Whole-batch failure reported in the stream
+                        raise RuntimeError(item.get('error', 'Batch failed'))
+                    index = pending[item['index']]
+                    item['index'] = index
+                    if 'error' not in item:
+                        self.cache.put(_query_key(queries[index], collections),
+                                       _cacheable({k: v for k, v in item.items() if k not in ('index', 'query')}))
+                    if ordered:
+                        yield from local_up_to(index)
+                    yield item
+        yield from local_up_to(len(queries))
+
+    # -- ingest and status -----------------------------------------------
+
+    def ingest(self, urls: List[str], collection: Optional[str] = None) -> dict:
+        """Start an ingest job. Not retried: a lost response must not start a second job."""
+        body = {'urls': urls, **({'collection': collection} if collection else {})}
+        return self._request('POST', '/api/ingest', retries=0, json=body).json()
+
+    def ingest_status(self, job_id: str) -> dict:
+        return self._request('GET', f'/api/ingest/{job_id}').json()
+
+    def wait_for_ingest(self, job_id: str, poll_seconds: float = 2, timeout: float = 3600) -> dict:
+        deadline = time.time() + timeout
+        while True:
+            job = self.ingest_status(job_id)
+            if job['status'] not in ('queued', 'running') or time.time() > deadline:
+                return job
+            time.sleep(poll_seconds)
+
+    def stats(self, timeout: float = 3) -> dict:
+        """Backend /api/stats; fails fast so a slow backend does not block the UI."""
+        return self._request('GET', '/api/stats', retries=0, timeout=timeout).json()
+
+    def collections(self) -> List[dict]:
+        return self._request('GET', '/api/collections').json()['collections']
+
+    def close(self):
+        self.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the Math Agent API")
+    parser.add_argument('query', nargs='?', help="a single question")
+    parser.add_argument('--batch', help="file with one question per line ('-' for stdin); prints JSON lines")
+    parser.add_argument('--collection', action='append', dest='collections', help="collection to search (repeatable)")
+    parser.add_argument('--url', default=API_URL)
+    args = parser.parse_args()
+
+    client = MathAgentClient(args.url)
+    try:
+        if args.batch:
+            source = sys.stdin if args.batch == '-' else open(args.batch)
+            with source:
+                queries = [line.strip() for line in source if line.strip()]
+            for item in client.batch(queries, args.collections):
+                print(json.dumps(item), flush=True)
+        elif args.query:
+            print(client.query(args.query, args.collections)['answer'])
+        else:
+            parser.error("give a question or --batch FILE")
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()